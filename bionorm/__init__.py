@@ -73,6 +73,7 @@ def cli(warnings_as_errors, **kwargs):
 from .consistency import consistency  # isort:skip
 from .prefix import prefix_fasta  # isort:skip
 from .prefix import prefix_gff  # isort:skip
+from .prefix import prefix_batch  # isort:skip
 from .extract_fasta import extract_fasta  # isort:skip
 from .installer import install  # isort:skip
 from .index import index_fasta  # isort:skip
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Read gzip/BGZF-compressed files and write BGZF files."""
+
+# standard library imports
+import gzip
+import io
+import multiprocessing
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# global constants
+GZIP_MAGIC = b"\x1f\x8b\x08"
+BGZF_HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+BGZF_EOF = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+BGZF_BLOCK_SIZE = 0xFF00  # uncompressed bytes per block, as in htslib
+BGZF_MAX_BLOCK = 0x10000  # maximum compressed size of a block
+BGZF_OVERHEAD = 26  # header and footer bytes in each block
+DEFAULT_COMPRESSLEVEL = 6
+BGZF_READ_SIZE = 1024 * 1024  # compressed bytes inflated per thread task
+
+
+def default_threads():
+    """Return inflation threads per reader: one per CPU, one in workers.
+
+    Readers in worker processes of a pool get one thread, since the
+    pool already keeps the CPUs busy.
+    """
+    if multiprocessing.current_process().name != "MainProcess":
+        return 1
+    return os.cpu_count() or 1
+
+
+def is_gzipped(path):
+    """Return True if path starts with gzip magic (includes BGZF)."""
+    with open(path, "rb") as fh:
+        return fh.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def is_bgzf(path):
+    """Return True if path is BGZF, i.e., gzip with a BC extra subfield."""
+    with open(path, "rb") as fh:
+        return fh.read(len(BGZF_HEADER)) == BGZF_HEADER
+
+
+def open_input(path, mode="rb", threads=None):
+    """Open plain, gzip, or BGZF file for reading in binary or text mode.
+
+    BGZF files are inflated on threads (default: one per CPU, one in worker
+    processes).
+    """
+    if is_bgzf(path):
+        reader = io.BufferedReader(BgzfReader(path, threads=threads))
+        if "t" in mode:
+            return io.TextIOWrapper(reader)
+        return reader
+    if is_gzipped(path):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def open_output(path, compress=False, mode="wb"):
+    """Open file for writing, as BGZF if compress is set."""
+    if not compress:
+        return open(path, mode)
+    writer = BgzfWriter(path)
+    if "t" in mode:
+        return io.TextIOWrapper(writer)
+    return writer
+
+
+def compress_block(data, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Return one BGZF block holding data (at most BGZF_BLOCK_SIZE bytes)."""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    if len(cdata) + BGZF_OVERHEAD > BGZF_MAX_BLOCK:  # incompressible data
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+    return b"".join(
+        (
+            BGZF_HEADER,
+            struct.pack("<H", len(cdata) + BGZF_OVERHEAD - 1),
+            cdata,
+            struct.pack("<II", zlib.crc32(data), len(data)),
+        )
+    )
+
+
+class BgzfWriter(io.RawIOBase):
+
+    """Binary file object that writes BGZF blocks."""
+
+    def __init__(self, path, compresslevel=DEFAULT_COMPRESSLEVEL):
+        """Open path for writing."""
+        super().__init__()
+        self.name = str(path)
+        self.compresslevel = compresslevel
+        self._fh = open(path, "wb")
+        self._buffer = bytearray()
+
+    def writable(self):
+        """Return True, BGZF writers are writable."""
+        return True
+
+    def write(self, data):
+        """Buffer data and write out every full block."""
+        self._buffer += data
+        if len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._write_blocks(final=False)
+        return len(data)
+
+    def _write_blocks(self, final):
+        """Compress buffered data, keeping a partial block unless final."""
+        pos = 0
+        with memoryview(self._buffer) as view:
+            while len(view) - pos >= BGZF_BLOCK_SIZE or (
+                final and pos < len(view)
+            ):
+                with view[pos : pos + BGZF_BLOCK_SIZE] as block:
+                    self._fh.write(compress_block(block, self.compresslevel))
+                    pos += len(block)
+        del self._buffer[:pos]
+
+    def close(self):
+        """Write remaining data and the EOF marker block."""
+        if not self.closed:
+            self._write_blocks(final=True)
+            self._fh.write(BGZF_EOF)
+            self._fh.close()
+        super().close()
+
+
+def block_size(buffer, pos):
+    """Return size of BGZF block at pos, None if its header is incomplete."""
+    if len(buffer) - pos < len(BGZF_HEADER):
+        return None
+    if buffer[pos : pos + 4] != b"\x1f\x8b\x08\x04":
+        raise OSError("not a BGZF block")
+    (xlen,) = struct.unpack_from("<H", buffer, pos + 10)
+    subfield_pos = pos + 12
+    extra_end = subfield_pos + xlen
+    if len(buffer) < extra_end:
+        return None
+    while subfield_pos < extra_end:
+        (subfield_len,) = struct.unpack_from("<H", buffer, subfield_pos + 2)
+        if buffer[subfield_pos : subfield_pos + 2] == b"BC":
+            return struct.unpack_from("<H", buffer, subfield_pos + 4)[0] + 1
+        subfield_pos += 4 + subfield_len
+    raise OSError("BGZF block without BC subfield")
+
+
+def inflate_blocks(blocks):
+    """Return inflated data of a list of BGZF blocks, checking CRCs."""
+    inflated = []
+    for block in blocks:
+        with memoryview(block) as view:
+            (xlen,) = struct.unpack_from("<H", view, 10)
+            data = zlib.decompress(view[12 + xlen : -8], -15)
+            crc, isize = struct.unpack_from("<II", view, len(view) - 8)
+        if zlib.crc32(data) != crc or len(data) != isize:
+            raise OSError("BGZF block fails CRC or size check")
+        inflated.append(data)
+    return b"".join(inflated)
+
+
+class BgzfReader(io.RawIOBase):
+
+    """Binary file object that inflates BGZF blocks on a thread pool.
+
+    Compressed data is read in the calling thread, split into blocks, and
+    inflated by worker threads (zlib releases the GIL); inflated data is
+    returned in file order.
+    """
+
+    def __init__(self, path, threads=None):
+        """Open path for reading."""
+        super().__init__()
+        self.name = str(path)
+        self.threads = threads or default_threads()
+        self._fh = open(path, "rb")
+        self._executor = ThreadPoolExecutor(max_workers=self.threads)
+        self._tasks = deque()  # inflation futures in file order
+        self._raw = b""  # compressed bytes of incomplete block
+        self._eof = False
+        self._data = memoryview(b"")
+
+    def readable(self):
+        """Return True, BGZF readers are readable."""
+        return True
+
+    def _submit_blocks(self):
+        """Read compressed data until enough blocks are being inflated."""
+        while not self._eof and len(self._tasks) < 2 * self.threads:
+            chunk = self._fh.read(BGZF_READ_SIZE)
+            if not chunk:
+                self._eof = True
+                if self._raw:
+                    raise OSError(f"{self.name} ends in a truncated block")
+                break
+            raw = self._raw + chunk if self._raw else chunk
+            blocks = []
+            pos = 0
+            while True:
+                size = block_size(raw, pos)
+                if size is None or pos + size > len(raw):
+                    break
+                blocks.append(raw[pos : pos + size])
+                pos += size
+            self._raw = raw[pos:]
+            if blocks:
+                self._tasks.append(
+                    self._executor.submit(inflate_blocks, blocks)
+                )
+
+    def readinto(self, buffer):
+        """Read inflated data into buffer, returning number of bytes."""
+        while not len(self._data):
+            self._submit_blocks()
+            if not self._tasks:
+                return 0
+            self._data = memoryview(self._tasks.popleft().result())
+        n_bytes = min(len(buffer), len(self._data))
+        buffer[:n_bytes] = self._data[:n_bytes]
+        self._data = self._data[n_bytes:]
+        return n_bytes
+
+    def readall(self):
+        """Read and return all remaining inflated data."""
+        chunks = [bytes(self._data)]
+        self._data = memoryview(b"")
+        while True:
+            self._submit_blocks()
+            if not self._tasks:
+                return b"".join(chunks)
+            chunks.append(self._tasks.popleft().result())
+
+    def close(self):
+        """Stop inflation threads and close file."""
+        if not self.closed:
+            for task in self._tasks:
+                task.cancel()
+            self._executor.shutdown(wait=True)
+            self._fh.close()
+        super().close()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Cache consistency check results of unchanged files.
+
+Results live in an SQLite database in the collection directory.  A
+result is used only if the file and its parent have the same size and
+mtime as when checked, and the checker version and options match.
+Sizes and mtimes are taken before a check runs, so a file changed while
+it is checked is checked again next time.
+"""
+# standard library imports
+import json
+import os
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+
+# module imports
+from .__version__ import __version__
+
+# global constants
+CACHE_FILENAME = "consistency_cache.sqlite"
+CACHE_SCHEMA = """CREATE TABLE IF NOT EXISTS results (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    options TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    seqids TEXT,
+    counts TEXT
+)"""
+
+CachedResult = namedtuple("CachedResult", ["passed", "seqids", "counts"])
+
+
+def file_key(path):
+    """Return path, size, and mtime of path as a string."""
+    if path is None:
+        return ""
+    stat = os.stat(path)
+    return f"{Path(path).resolve()}\t{stat.st_size}\t{stat.st_mtime_ns}"
+
+
+def file_state(target, parent):
+    """Return size and mtime of target and file_key of parent."""
+    stat = os.stat(target)
+    return stat.st_size, stat.st_mtime_ns, file_key(parent)
+
+
+class CheckCache:
+
+    """Pass/fail, seqids, and feature counts of checked files."""
+
+    def __init__(self, collection_home, options):
+        """Open or create the cache database in collection_home."""
+        self.path = Path(collection_home) / CACHE_FILENAME
+        self.options = json.dumps(options, sort_keys=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute(CACHE_SCHEMA)
+
+    def lookup(self, target, parent):
+        """Return CachedResult for target, None if stale or missing."""
+        path = str(Path(target).resolve())
+        row = self._db.execute(
+            "SELECT size, mtime_ns, version, options, parent, passed,"
+            " seqids, counts FROM results WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, version, options, parent_key = row[:5]
+        stat = os.stat(target)
+        if (
+            (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns)
+            or version != __version__
+            or options != self.options
+            or parent_key != file_key(parent)
+        ):
+            return None
+        passed, seqids, counts = row[5:]
+        return CachedResult(
+            bool(passed),
+            frozenset(seqids.split("\n")) if seqids else frozenset(),
+            json.loads(counts) if counts else None,
+        )
+
+    def store(self, target, state, passed, seqids=(), counts=None):
+        """Record result of checking target, with file_state from before."""
+        size, mtime_ns, parent_key = state
+        self._db.execute(
+            "INSERT OR REPLACE INTO results"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                str(Path(target).resolve()),
+                size,
+                mtime_ns,
+                __version__,
+                self.options,
+                parent_key,
+                int(passed),
+                "\n".join(sorted(seqids)) if seqids else None,
+                json.dumps(counts) if counts else None,
+            ),
+        )
+        self._db.commit()
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
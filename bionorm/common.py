@@ -14,6 +14,9 @@ import toml
 import click
 from addict import Dict
 
+# module imports
+from .outputs import HIDDEN_PREFIX
+
 #
 # global constants
 #
@@ -45,6 +48,7 @@ GENOME_SUBTYPES = {
 GENUS_CODE_LEN = 3
 SPECIES_CODE_LEN = 2
 KEY_LEN = 4
+FASTA_BLOCK_SIZE = 8 * 1024 * 1024  # bytes per read when scanning FASTA
 DIR_DESCRIPTORS = [
     "ann",
     "bac",
@@ -99,6 +103,14 @@ for localename in ["en_US", "en_US.utf8", "English_United_States"]:
 #
 # helper functions used in multiple places
 #
+def next_fasta_header(block, start):
+    """Return position of next ">" at a line start after start, or -1."""
+    pos = block.find(b"\n>", start)
+    if pos == -1:
+        return -1
+    return pos + 1
+
+
 def get_user_context_obj():
     """Return user context, containing logging and configuration data.
 
@@ -530,23 +542,28 @@ class CollectionPath(PosixPath):
 
     def n_files(self):
         if self.is_dir:
-            return len([f for f in self.glob("*") if f.is_file()])
+            return len([f for f in self.glob("*") if is_data_file(f)])
         else:
             return None
 
 
+def is_data_file(path):
+    """Return True if path is a file other than a sidecar or partial output."""
+    return path.is_file() and not path.name.startswith(HIDDEN_PREFIX)
+
+
 def args_to_pathlist(nodelist, directory, recurse):
     """Process optional list of files."""
     if nodelist == ():  # empty nodelist
         if directory:
             pathlist = [Path(".")]
         else:
-            pathlist = [p for p in Path(".").glob("*") if p.is_file()]
+            pathlist = [p for p in Path(".").glob("*") if is_data_file(p)]
     else:
-        pathlist = [n for n in Path(nodelist[0]).glob("*") if n.is_file()]
+        pathlist = [n for n in Path(nodelist[0]).glob("*") if is_data_file(n)]
     if recurse:
         filelist = []
         for node in nodelist:
-            filelist += [f for f in Path(node).rglob("*") if f.is_file()]
+            filelist += [f for f in Path(node).rglob("*") if is_data_file(f)]
         pathlist = filelist
     return pathlist
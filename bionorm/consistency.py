@@ -4,42 +4,85 @@ import json
 import os
 import re
 import sys
-import subprocess
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
 from glob import glob
 from pathlib import Path
 
 # first-party imports
 import click
 from loguru import logger
-from sequencetools.tools.basic_fasta_stats import basic_fasta_stats
-from sequencetools.helpers.file_helpers import return_filehandle
 
 # module imports
 from . import cli
 from . import click_loguru
 from . import specification_checks
+from .bgzf import open_input
+from .check_cache import CheckCache
+from .check_cache import file_state
+from .common import COLLECTION_DIR
+from .common import find_collection_home
+from .outputs import HIDDEN_PREFIX
+from .stats import fasta_stats
+from .stats import gff_stats
 
 # global defs
 DOMAIN = "https://legumeinfo.org/data/public"
 FASTA_TYPES = ("fna", "faa", "fasta", "frn")
 GFF_TYPES = ("gff", "gff3")
+NO_SEQIDS = frozenset()  # seqids of a child without a genome_main parent
+NODE_STATS_TYPES = ("genome_main", "gene_models_main")
 
 
-def count_gff_features(gff):
-    counts = {}
-    with return_filehandle(Path(gff)) as fopen:
-        for line in fopen:
-            if (
-                not line or line.isspace() or line.startswith("#")
-            ):  # skip comments
-                continue
-            line = line.rstrip()
-            f = line.split("\t")  # get fields
-            if f[2] not in counts:  # feature type
-                counts[f[2]] = 1
-                continue
-            counts[f[2]] += 1
-    return counts
+def reference_key(data_dir, filename):
+    """Return key by which children find a reference file, None if not one.
+
+    Keys are (infraspecies, gnm, ann, canonical_type, platform), with
+    None for parts that do not identify the reference.
+    """
+    attributes = filename.split(".")
+    dir_attributes = data_dir.split(".")
+    if (
+        filename.startswith(HIDDEN_PREFIX)
+        or not filename.endswith(".gz")
+        or len(attributes) < 5
+        or len(dir_attributes) < 3
+    ):
+        return None
+    if attributes[-3] in ("genome_main", "gene_models_main"):
+        infraspecies, gnm = dir_attributes[:2]
+        ann = dir_attributes[2] if len(dir_attributes) > 3 else None
+        return (infraspecies, gnm, ann, attributes[-3], None)
+    if (
+        attributes[-5] == "mrk"
+        and attributes[-2] == "gff3"
+        and "mrk" in dir_attributes
+    ):
+        return (None, None, None, "mrk", attributes[-3])  # by platform
+    return None
+
+
+def read_metadata_header(path):
+    """Return dictionary of key/value lines heading a tab-delimited file.
+
+    Comment marks and trailing empty fields are stripped from header
+    lines, and lines that are not key/value pairs are skipped.  Reading
+    stops at the first data row, a line of three or more fields, so the
+    rest of the file is never decompressed.
+    """
+    header = {}
+    with open_input(path, "rt") as fh:
+        for line in fh:
+            fields = [f.strip() for f in line.lstrip("#").split("\t")]
+            while fields and not fields[-1]:
+                fields.pop()
+            if len(fields) == 2 and fields[0]:
+                header.setdefault(fields[0], fields[1])
+            elif len(fields) > 2 and not line.startswith("#"):
+                break  # data row
+    return header
 
 
 class Detector:
@@ -55,7 +98,10 @@ class Detector:
         gene_models_main,
         genometools,
         fasta_headers,
-        disable_all
+        disable_all,
+        feature_order=False,
+        jobs=1,
+        use_cache=True,
     ):
         """Check for check for gt"""
         self.checks = {}  # object that determines which checks are skipped
@@ -63,9 +109,12 @@ class Detector:
         self.checks["gene_models_main"] = gene_models_main
         self.checks["perform_gt"] = genometools
         self.checks["fasta_headers"] = fasta_headers
+        self.checks["feature_order"] = feature_order
         self.nodes = nodes
         self.busco = busco
         self.disable_all = disable_all
+        self.jobs = jobs
+        self.use_cache = use_cache
         self.options = {}
         self.canonical_types = [
             "genome_main",
@@ -99,10 +148,15 @@ class Detector:
         self.write_me = {}
         self.passed = {}  # dictionary of passing names
         self.target_objects = {}  # store all target pairings self.get_targets
-        self.fasta_ids = {}
+        self.reference_indexes = {}  # organism dir -> reference files by key
+        self.metadata_headers = {}  # gwas/phen/mrk file -> header values
+        self.reference_ids = {}  # seqids for children left to check
+        self.unchecked_children = {}  # count of children left to check
+        self.feature_counts = {}  # node stats gathered during checks
         self.reporting = {}
         self.node_data = {}  # nodes for DSCensor
         self.target = Path(target)
+        self.root_target = self.target  # self.target moves during the walk
         self.target_readme = ""
         self.target_name = os.path.basename(self.target)
         self.target_type = self.get_target_type()
@@ -247,18 +301,24 @@ class Detector:
         }
         if len(target_attributes) > 7 and target_ref_type:  # check parent
             logger.debug("Target Derived from Some Reference Searching...")
-            ref_glob = f"{organism_dir_path}/{ '.'.join(target_attributes[1:3])}*/*{target_ref_type}.*.gz"
+            infraspecies, gnm, ann = target_attributes[1:4]
+            key = (infraspecies, gnm, None, target_ref_type, None)
             if self.rank[canonical_type] > 1:  # feature has a subtype
-                ref_glob = f"{organism_dir_path}/{'.'.join(target_attributes[1:4])}*/*{target_ref_type}.*.gz"
-                if canonical_type == 'gwas':  # mrk is parent and needs be read from PlatformName in gwas file
-                    cmd = f'zgrep PlatformName {self.target}'
-                    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-                    platformname = proc.communicate()[0].decode('utf-8').rstrip().split('\t')[1]
-                    ref_glob = f"{organism_dir_path}/*.mrk.*/*mrk.*.{platformname}.gff3.gz"
-                elif canonical_type == 'phen':  # gwas is parent
-
-                    ref_glob = 'gwas'.join(str(self.target).rsplit('phen', 1))
-            my_reference = self.get_reference(ref_glob)
+                key = (infraspecies, gnm, ann, target_ref_type, None)
+                if canonical_type == "gwas":  # mrk parent is PlatformName
+                    header = self.metadata_header(self.target)
+                    if "PlatformName" not in header:
+                        logger.error(f"No PlatformName in {self.target}")
+                        sys.exit(1)
+                    platform = header["PlatformName"]
+                    key = (None, None, None, target_ref_type, platform)
+            if canonical_type == "phen":  # gwas is parent
+                gwas = "gwas".join(str(self.target).rsplit("phen", 1))
+                references = [gwas] if os.path.isfile(gwas) else []
+            else:
+                index = self.reference_index(organism_dir_path)
+                references = index.get(key, [])
+            my_reference = self.get_reference(references, key)
             logger.info(my_reference)
             if my_reference not in self.target_objects:  # new parent
                 parent_name = os.path.basename(my_reference)
@@ -320,16 +380,44 @@ class Detector:
                     "children": {},
                 }
 
-    def get_reference(self, glob_target):
-        """Finds the FASTA reference for some prefix"""
-        if len(glob(glob_target)) > 1:  # too many references....?
-            logger.error(f"Multiple references found {glob(glob_target)}")            
-#            sys.exit(1)
-        reference = glob(glob_target)
-        if not reference:  # if the objects parent could not be found
-            logger.error(f"Could not find ref glob: {glob_target}")
+    def reference_index(self, organism_dir_path):
+        """Return reference files of an organism directory by key.
+
+        Directories are listed once; keys are those of reference_key.
+        """
+        index = self.reference_indexes.get(organism_dir_path)
+        if index is not None:
+            return index
+        index = {}
+        for data_dir in sorted(os.listdir(organism_dir_path)):
+            data_dir_path = f"{organism_dir_path}/{data_dir}"
+            if not os.path.isdir(data_dir_path):
+                continue
+            for filename in sorted(os.listdir(data_dir_path)):
+                key = reference_key(data_dir, filename)
+                if key is not None:
+                    index.setdefault(key, []).append(
+                        f"{data_dir_path}/{filename}"
+                    )
+        self.reference_indexes[organism_dir_path] = index
+        return index
+
+    def metadata_header(self, path):
+        """Return metadata header of path, reading each file once."""
+        header = self.metadata_headers.get(path)
+        if header is None:
+            header = read_metadata_header(path)
+            self.metadata_headers[path] = header
+        return header
+
+    def get_reference(self, references, key):
+        """Return the one reference file found for key"""
+        if len(references) > 1:  # too many references....?
+            logger.error(f"Multiple references found {references}")
+        if not references:  # if the objects parent could not be found
+            logger.error(f"Could not find reference for {key}")
             sys.exit(1)
-        reference = glob(glob_target)[0]
+        reference = references[0]
         if not os.path.isfile(reference):  # if cannot find reference file
             logger.error(f"Could not find main target {reference}")
             sys.exit(1)
@@ -340,10 +428,16 @@ class Detector:
         """Write DSCensor object node."""
         my_name = self.write_me["filename"]
         if self.write_me["canonical_type"] == "genome_main":
-            return
-            self.write_me["counts"] = basic_fasta_stats(self.target, 10, False)
+            stats = self.feature_counts.pop(self.target, None)
+            if stats is None:  # checks disabled, compute now
+                stats = fasta_stats(self.target)
+            self.write_me["counts"] = stats
         elif self.write_me["canonical_type"] == "gene_models_main":
-            self.write_me["counts"] = count_gff_features(self.target)
+            stats = self.feature_counts.pop(self.target, None)
+            if stats is None:  # checks disabled, count now
+                stats = gff_stats(self.target)
+            self.write_me["counts"] = stats["counts"]
+            self.write_me["stats"] = stats["stats"]
         my_file = open(f"./{my_name}.json", "w")
         my_file.write(json.dumps(self.write_me))
         my_file.close()
@@ -388,82 +482,210 @@ class Detector:
                 elif fields[2].startswith("Total"):
                     node_data["busco"]["total_buscos"] = fields[1]
 
+    def check_graph(self):
+        """Return types, node data, parents, and children of all files."""
+        types = {}
+        node_data = {}
+        parents = {}
+        children = {}
+        for reference, target_object in self.target_objects.items():
+            types.setdefault(reference, target_object["type"])
+            node_data.setdefault(reference, target_object["node_data"])
+            for child, child_object in target_object["children"].items():
+                types[child] = child_object["type"]
+                node_data[child] = child_object["node_data"]
+                parents[child] = reference
+                children.setdefault(reference, []).append(child)
+        return types, node_data, parents, children
+
+    def check_context(self, target, target_type, parent):
+        """Return the picklable context a check of target needs."""
+        if target_type == "genome_main":  # filled by the check
+            fasta_ids = set()
+        else:  # seqids of parent genome
+            fasta_ids = self.reference_ids.get(parent, NO_SEQIDS)
+        return CheckContext(
+            target,
+            parent,
+            self.checks,
+            self.nodes,
+            fasta_ids,
+            file_state(target, parent),  # before the check runs
+        )
+
     def detect_incongruencies(self):
-        """Check consistencies in all objects."""
-        targets = self.target_objects  # get objects from class init
-        busco = self.busco  # if true, run BUSCO
-        nodes = self.nodes  # if true, generate nodes for DSCensor
-        for reference in sorted(targets, key=lambda k: self.rank[targets[k]["type"]]):
-            #            logger.info('HERE {}'.format(reference))
-            if reference not in self.passed:
-                self.passed[reference] = 0
-                self.target = reference
-                ref_method = getattr(
-                    specification_checks,
-                    targets[reference]["type"],  # reads checks from spec
-                )  # type ex genome_main
-                if (
-                    not ref_method
-                ):  # if the target isnt in the hierarchy continue
-                    logger.debug(
-                        f"Check for {targets[reference]['type']} does not"
-                        " exist"
+        """Check consistencies in all objects.
+
+        Each file is checked once its parent has been, so that seqids of
+        a genome are known before its gene models are checked.  Seqids
+        are released once all children of a reference are checked.  With
+        jobs > 1, checks of independent files run in a process pool.
+        """
+        types, node_data, parents, children = self.check_graph()
+        self.unchecked_children = {r: len(c) for r, c in children.items()}
+        by_rank = lambda k: (self.rank[types[k]], k)
+        roots = [t for t in types if t not in parents]
+        ready = deque(sorted(roots, key=by_rank))
+        executor = None
+        if self.jobs > 1 and not self.disable_all:
+            executor = ProcessPoolExecutor(max_workers=self.jobs)
+        cache = self.open_cache()
+        running = {}  # future -> target
+        while ready or running:
+            while ready:
+                target = ready.popleft()
+                self.passed[target] = 0
+                logger.info(f"Performing Checks for {target}")
+                context = self.check_context(
+                    target, types[target], parents.get(target)
+                )
+                cached = None
+                if cache is not None:
+                    cached = cache.lookup(target, context.parent)
+                if cached is not None and self.lacks_stats(
+                    cached, types[target]
+                ):
+                    cached = None  # check again to compute node stats
+                if self.disable_all:
+                    passed = True
+                elif cached is not None:
+                    passed = use_cached_check(cached, context)
+                elif executor is None:
+                    passed, context = run_check(
+                        types[target], context, self.options
+                    )
+                    cache_check(cache, passed, context)
+                else:
+                    future = executor.submit(
+                        run_check, types[target], context, self.options
                     )
+                    running[future] = target
                     continue
-                logger.debug(ref_method)
-                my_detector = ref_method(self, **self.options)
-                passed = True
-                if not self.disable_all:
-                    passed = my_detector.run()
-                if (
-                    passed
-                ):  # validation passed writing object node for DSCensor
-                    self.passed[reference] = 1
-                    self.node_data = targets[reference]["node_data"]
-                    if nodes:
-                        logger.info(f"Writing node object for {reference}")
-                        # dscensor node
-                        self.check_busco()
-                        self.write_me = targets[reference]["node_data"]
-                        self.write_node_object()  # write node for dscensor loading
-                logger.debug(f"{targets[reference]}")
-            if self.target_objects[reference]["children"]:  # process children
-                self.parent = reference
-                children = self.target_objects[reference]["children"]
-                for c in children:
-                    if c in self.passed:
-                        logger.debug(f"Child {c} Already Passed")
-                        continue
-
-                    self.passed[c] = 0
-                    #                    logger.info('HERE child {}'.format(c))
-                    logger.info(f"Performing Checks for {c}")
-                    self.target = c
-                    child_method = getattr(
-                        specification_checks,
-                        children[c]["type"],  # check for spec
-                    )  # exgene_models_main
-                    if not child_method:
-                        logger.warning(
-                            f"Check for {children[c]['type']} does not exist"
-                        )
-                        continue
-                    logger.debug(child_method)
-                    my_detector = child_method(self, **self.options)
-                    passed = True
-                    if not self.disable_all:
-                        passed = my_detector.run()
-                    if (
-                        passed
-                    ):  # validation passed writing object node for DSCensor
-                        self.passed[c] = 1
-                        self.node_data = children[c]["node_data"]
-                        if nodes:
-                            logger.info(f"Writing node object for {c}")
-                            self.check_busco()
-                            self.write_me = children[c]["node_data"]
-                            self.write_node_object()
-                    logger.debug(f"{c}")
+                self.finish_check(target, node_data[target], passed, context)
+                ready.extend(sorted(children.get(target, []), key=by_rank))
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: by_rank(running[f])):
+                    target = running.pop(future)
+                    passed, context = future.result()
+                    cache_check(cache, passed, context)
+                    self.finish_check(
+                        target, node_data[target], passed, context
+                    )
+                    ready.extend(sorted(children.get(target, []), key=by_rank))
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.close()
+
+    def lacks_stats(self, cached, target_type):
+        """Return True if nodes need stats that cached result lacks."""
+        return (
+            self.nodes
+            and cached.passed
+            and cached.counts is None
+            and target_type in NODE_STATS_TYPES
+        )
+
+    def open_cache(self):
+        """Return cache of check results in collection, None if unused."""
+        if not self.use_cache or self.disable_all:
+            return None
+        collection_home = find_collection_home(self.root_target)
+        if collection_home is None:
+            logger.debug(f"No {COLLECTION_DIR} directory, results not cached")
+            return None
+        return CheckCache(
+            collection_home, {"checks": self.checks, "options": self.options}
+        )
+
+    def finish_check(self, target, target_node_data, passed, context):
+        """Record result of check of target and write its node object."""
+        if self.unchecked_children.get(target):  # seqids for children
+            self.reference_ids[target] = context.fasta_ids or (
+                self.reference_ids.get(context.parent, NO_SEQIDS)
+            )
+        if context.parent is not None:
+            self.unchecked_children[context.parent] -= 1
+            if not self.unchecked_children[context.parent]:
+                self.reference_ids.pop(context.parent, None)
+        if not passed:  # None when no check exists for the type
+            return
+        self.passed[target] = 1  # validation passed writing node object
+        self.target = target
+        self.node_data = target_node_data
+        if self.nodes:  # node stats are popped as node objects are written
+            self.feature_counts.update(context.feature_counts)
+            logger.info(f"Writing node object for {target}")
+            self.check_busco()  # dscensor node
+            self.write_me = target_node_data
+            self.write_node_object()  # write node for dscensor loading
+
+
+class CheckContext:
+
+    """What a specification check needs from the Detector.
+
+    Unlike the Detector, a context can be sent to a worker process.
+    Checks of genome_main fill fasta_ids; when nodes are written, checks
+    of genomes and gene models fill feature_counts with node stats.
+    """
+
+    def __init__(self, target, parent, checks, nodes, fasta_ids, state=None):
+        """Set target file, its parent, enabled checks, and file state."""
+        self.target = target
+        self.parent = parent
+        self.state = state  # check_cache.file_state of files checked
+        self.checks = checks
+        self.nodes = nodes
+        self.fasta_ids = fasta_ids
+        self.feature_counts = {}
+
+
+def run_check(target_type, context, options):
+    """Run specification check of target_type, returning (passed, context).
+
+    passed is None if no check exists for target_type.
+    """
+    check = getattr(specification_checks, target_type, None)
+    if check is None:
+        logger.warning(f"Check for {target_type} does not exist")
+        return None, context
+    passed = check(context, **options).run()
+    if target_type == "genome_main":
+        context.fasta_ids = frozenset(context.fasta_ids)
+        if passed and context.nodes:  # assembly stats of the node
+            context.feature_counts[context.target] = fasta_stats(
+                context.target
+            )
+    else:  # no need to send seqids back
+        context.fasta_ids = NO_SEQIDS
+    return passed, context
+
+
+def use_cached_check(cached, context):
+    """Fill context from cached result, returning whether check passed."""
+    if cached.passed:
+        logger.info(f"{context.target} unchanged since it passed checks")
+    else:
+        logger.error(f"{context.target} unchanged since it FAILED checks")
+    context.fasta_ids = cached.seqids
+    if cached.counts is not None:
+        context.feature_counts = {context.target: cached.counts}
+    return cached.passed
+
+
+def cache_check(cache, passed, context):
+    """Store result of check in cache, if any."""
+    if cache is None or passed is None:  # no check for this type
+        return
+    cache.store(
+        context.target,
+        context.state,
+        passed,
+        seqids=context.fasta_ids,
+        counts=context.feature_counts.get(context.target),
+    )
 
 
 @cli.command()
@@ -502,6 +724,23 @@ class Detector:
     is_flag=True,
     help="""Check consistency of FASTA headers and GFF.""",
 )
+@click.option(
+    "--feature_order",
+    is_flag=True,
+    help="""Check that GFF features are sorted by position and type.""",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="""Processes for checking independent files.""",
+)
+@click.option(
+    "--no_cache",
+    is_flag=True,
+    help=f"""Recheck files whose results are cached in {COLLECTION_DIR}.""",
+)
 @click.option(
     "--disable_all",
     is_flag=True,
@@ -516,6 +755,9 @@ def consistency(
     gene_models_main,
     genometools,
     fasta_headers,
+    feature_order,
+    jobs,
+    no_cache,
     disable_all
 ):
     """Perform consistency checks on target directory."""
@@ -527,6 +769,9 @@ def consistency(
         gene_models_main=gene_models_main,
         genometools=genometools,
         fasta_headers=fasta_headers,
-        disable_all=disable_all
+        disable_all=disable_all,
+        feature_order=feature_order,
+        jobs=jobs,
+        use_cache=not no_cache,
     )  # initialize class
     detector.detect_incongruencies()  # run all detection methods
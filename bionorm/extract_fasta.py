@@ -1,68 +1,215 @@
 # -*- coding: utf-8 -*-
 """Extract rRNA, CDS, and protein sequences defined in GFF from genome sequence."""
 # standard library imports
+import contextlib
 import os
 import subprocess
 import sys
+import tempfile
+from pathlib import Path
 
 # first-party imports
 import click
 from loguru import logger
-from sequencetools.helpers import sequence_helpers
 
 # module imports
 from . import cli
 from . import click_loguru
+from .extraction import extract_sequences
+from .extraction import isoform_gene_id
+from .extraction import read_transcripts
+from .faidx import fai_path
+from .faidx import index_is_current
+from .faidx import write_indexes
+from .outputs import AtomicOutputs
 
 
-def primary_transcript_check(peptides):
-    """Select the longest isoforms as the primary transcripts."""
-    seq_handle = open(peptides, "rt")
+def longest_isoforms(peptides):
+    """Return count of records and (length, offset, size) of longest per gene.
+
+    Only byte offsets and sizes of records are kept, not sequences.
+    Raises ValueError on a header without ID.
+    """
     longest = {}
     count = 0
-    primary = (
-        f"{'.'.join(peptides.split('.')[:-2])}.protein_primaryTranscript.faa"
-    )
-    for record in sequence_helpers.get_seqio_fasta_record(seq_handle):
-        from_ncbi = ["GCF", "GCA"]  # GCF or GCA usually add more
-        count += 1
-        my_record = f">{record.id}\n{record.seq}"
-        my_obj = {"record": my_record, "length": len(record.seq)}
-        ncbi_check = record.id.split(".")[1].split("_")[0]  
-#        if ncbi_check in from_ncbi:  # is this from NCBI
-        gene_id = record.id
-        try:
-            int(record.id.split(".")[-1])  # check for isoform
-            gene_id = ".".join(record.id.split(".")[:-1])
-        except:
-            pass
-        if gene_id not in longest:
-            longest[gene_id] = my_obj
-        else:
-            if len(record.seq) > longest[gene_id]["length"]:
-                longest[gene_id] = my_obj
+    record = None  # [gene_id, length, offset]
+    offset = 0
+    with open(peptides, "rb") as seq_handle:
+        for line in seq_handle:
+            if line.startswith(b">"):
+                if record is not None:
+                    add_isoform(longest, record, offset)
+                count += 1
+                fields = line[1:].split(maxsplit=1)
+                if not fields:
+                    raise ValueError(
+                        f"Record {count} of {peptides} has no ID in its header"
+                    )
+                record = [isoform_gene_id(fields[0].decode()), 0, offset]
+            elif record is not None:
+                record[1] += len(line.strip())
+            offset += len(line)
+    if record is not None:
+        add_isoform(longest, record, offset)
+    return count, longest
+
+
+def add_isoform(longest, record, end):
+    """Keep record in longest if it is the longest isoform of its gene."""
+    gene_id, length, offset = record
+    if gene_id not in longest or length > longest[gene_id][0]:
+        longest[gene_id] = (length, offset, end - offset)
+
+
+def primary_transcript_check(peptides, primary=None):
+    """Select the longest isoforms as the primary transcripts.
+
+    Offsets of the longest isoform of each gene are found in a first
+    pass; a second pass copies those records from peptides.
+    """
+    if primary is None:
+        primary = (
+            f"{'.'.join(peptides.split('.')[:-2])}"
+            ".protein_primaryTranscript.faa"
+        )
+    try:
+        count, longest = longest_isoforms(peptides)
+    except ValueError as error:
+        logger.error(error)
+        sys.exit(1)
     if len(longest) == count:
         # add copy file
-        logger.info("All proteins are primary transcripts. will not generate protein_primaryTranscripts file.")
+        logger.info(
+            "All proteins are primary transcripts. will not generate"
+            " protein_primaryTranscripts file."
+        )
         return  # protein file is already primary
-    primary_handle = open(primary, "w")
-    for r in longest:
-        primary_handle.write(longest[r]["record"] + "\n")
-    primary_handle.close()
+    with open(peptides, "rb") as seq_handle, open(
+        primary, "wb"
+    ) as primary_handle:
+        for length, offset, size in longest.values():
+            seq_handle.seek(offset)
+            record = seq_handle.read(size)
+            primary_handle.write(record)
+            if not record.endswith(b"\n"):
+                primary_handle.write(b"\n")
     return primary
 
 
-def run_gffread(gff, fastapath):
-    """Read gff3 file and write mRNA, CDS and peptides."""
+def extraction_paths(gff):
+    """Return paths of mRNA, CDS, protein, and primary transcript outputs."""
     gff_dir = os.path.dirname(gff)
     gff_attributes = os.path.basename(gff).split(".")
-    mrna = f"{gff_dir}/{'.'.join(gff_attributes[:5])}.mrna.fna"
-    cds = f"{gff_dir}/{'.'.join(gff_attributes[:5])}.cds.fna"
-    pep = f"{gff_dir}/{'.'.join(gff_attributes[:5])}.protein.faa"
-    cmd = f"gffread {gff} -g {fastapath} -w {mrna} -x {cds} -y {pep} -W"
-    # print("cmd=", cmd)
-    subprocess.check_call(cmd, shell=True)
-    primary_transcript_check(pep)
+    stem = f"{gff_dir}/{'.'.join(gff_attributes[:5])}"
+    return (
+        f"{stem}.mrna.fna",
+        f"{stem}.cds.fna",
+        f"{stem}.protein.faa",
+        f"{stem}.protein_primaryTranscript.faa",
+    )
+
+
+def index_genome(fastapath, index):
+    """Write indexes of fastapath to index plus suffix."""
+    logger.info(f"Writing index {fai_path(index)}")
+    try:
+        write_indexes(fastapath, index=index)
+    except ValueError as error:
+        logger.error(f"Cannot index {fastapath}: {error}")
+        sys.exit(1)
+
+
+@contextlib.contextmanager
+def genome_index(fastapath, write=False):
+    """Yield path that suffixes of current indexes of fastapath extend.
+
+    Missing or stale indexes are written next to fastapath if write is
+    set, else to a temporary directory removed on exit, so that the
+    genome directory is left as it was.
+    """
+    if index_is_current(fastapath):
+        yield fastapath
+    elif write:
+        index_genome(fastapath, fastapath)
+        yield fastapath
+    else:
+        with tempfile.TemporaryDirectory(prefix="genome_index_") as tmp:
+            index = Path(tmp) / Path(fastapath).name
+            index_genome(fastapath, index)
+            yield index
+
+
+def run_extraction(gff, fastapath, force=False, jobs=1, write_index=False):
+    """Read gff3 file and write mRNA, CDS and peptides in-process.
+
+    Outputs up to date with gff and fastapath are kept unless force is set.
+    With jobs > 1, seqids are extracted in parallel.  Genome indexes are
+    written next to fastapath only if write_index is set.
+    """
+    mrna, cds, pep, primary = extraction_paths(gff)
+    outputs = AtomicOutputs(
+        [mrna, cds, pep],
+        [gff, fastapath],
+        {"command": "extract-fasta", "engine": "bionorm"},
+        optional=[primary],
+    )
+    if not force and outputs.up_to_date():
+        logger.info(f"{pep} is up to date with {gff} and {fastapath}")
+        return
+    transcripts = read_transcripts(gff)
+    with genome_index(fastapath, write=write_index) as index, outputs:
+        with open(outputs.path(mrna), "wb") as mrna_fh, open(
+            outputs.path(cds), "wb"
+        ) as cds_fh, open(outputs.path(pep), "wb") as pep_fh:
+            try:
+                longest = extract_sequences(
+                    transcripts,
+                    fastapath,
+                    mrna_fh,
+                    cds_fh,
+                    pep_fh,
+                    jobs=jobs,
+                    index=index,
+                )
+            except ValueError as error:
+                logger.error(error)
+                sys.exit(1)
+        if longest.all_primary():
+            logger.info(
+                "All proteins are primary transcripts. will not generate"
+                " protein_primaryTranscripts file."
+            )
+        else:
+            longest.write(outputs.path(pep), outputs.path(primary))
+        outputs.commit()
+
+
+def run_gffread(gff, fastapath, force=False):
+    """Read gff3 file and write mRNA, CDS and peptides with gffread.
+
+    Outputs up to date with gff and fastapath are kept unless force is set.
+    """
+    mrna, cds, pep, primary = extraction_paths(gff)
+    outputs = AtomicOutputs(
+        [mrna, cds, pep],
+        [gff, fastapath],
+        {"command": "extract-fasta", "engine": "gffread"},
+        optional=[primary],
+    )
+    if not force and outputs.up_to_date():
+        logger.info(f"{pep} is up to date with {gff} and {fastapath}")
+        return
+    with outputs:
+        cmd = (
+            f"gffread {gff} -g {fastapath} -w {outputs.path(mrna)}"
+            f" -x {outputs.path(cds)} -y {outputs.path(pep)} -W"
+        )
+        # print("cmd=", cmd)
+        subprocess.check_call(cmd, shell=True)
+        primary_transcript_check(
+            str(outputs.path(pep)), str(outputs.path(primary))
+        )
+        outputs.commit()
 
 
 @cli.command()
@@ -70,12 +217,43 @@ def run_gffread(gff, fastapath):
 @click.argument(
     "fastapath", type=click.Path(exists=True, readable=True, dir_okay=False)
 )
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Rewrite outputs even if up to date with inputs.",
+)
+@click.option(
+    "--gffread",
+    is_flag=True,
+    default=False,
+    help="Extract with external gffread instead of in-process.",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Processes for extracting sequences of different seqids.",
+)
+@click.option(
+    "--index",
+    is_flag=True,
+    default=False,
+    help="Write missing or stale genome indexes next to the genome.",
+)
 @click.argument(
     "gffpath", type=click.Path(exists=True, readable=True, dir_okay=False)
 )
-def extract_fasta(fastapath, gffpath):
+def extract_fasta(fastapath, gffpath, force, gffread, jobs, index):
     """Extract cds, mrna, and protein files from fasta and gff.
 
+    Outputs are written to temporary files and renamed when complete;
+    outputs up to date with their inputs are kept unless --force is given.
+    The genome may be plain or bgzip-compressed.  Its .fai/.gzi indexes
+    are used if current, else built in a temporary directory, or next to
+    the genome if --index is given.
+
     \b
     Example:
         bionorm extract-fasta \\
@@ -85,10 +263,15 @@ def extract_fasta(fastapath, gffpath):
     """
     # gffpath = os.path.abspath(gffpath)  # get full path
     gffpath_attributes = os.path.basename(gffpath).split(".")
-    if os.path.basename(fastapath).split(".")[-1] == "gz":
+    if gffread and os.path.basename(fastapath).split(".")[-1] == "gz":
         logger.error("GFFREAD cannot process compressed fasta as fastapath")
         sys.exit(1)
     if len(gffpath_attributes) < 7:
         logger.error(f"Target file {gffpath} is not delimited correctly")
         sys.exit(1)
-    run_gffread(gffpath, fastapath)
+    if gffread:
+        run_gffread(gffpath, fastapath, force=force)
+    else:
+        run_extraction(
+            gffpath, fastapath, force=force, jobs=jobs, write_index=index
+        )
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""Extract spliced mRNA, CDS, and protein sequences of GFF3 transcripts.
+
+Transcripts are the features that exons or CDS segments name as Parent.
+Genome sequence is read by random access through a .fai index: memory
+mapped if uncompressed, else one seqid at a time with a .gzi index.
+Records are wrapped at 70 columns as gffread wraps them, but deflines
+hold only the transcript ID, without the coordinates of gffread -W.
+"""
+# standard library imports
+import itertools
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# third-party imports
+import numpy as np
+
+# module imports
+from .faidx import open_genome
+from .gff import GffScan
+from .gff import parse_ids
+
+# global constants
+CODON_BASES = "TCAG"
+CODON_TABLE = (  # standard code, codons ordered by CODON_BASES
+    "FFLLSSSSYY..CC.WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+)
+UNKNOWN_AMINO_ACID = "X"
+IUPAC_BASES = {  # nucleotide code -> bases it stands for
+    "T": "T",
+    "U": "T",
+    "C": "C",
+    "A": "A",
+    "G": "G",
+    "Y": "TC",
+    "R": "AG",
+    "W": "TA",
+    "S": "CG",
+    "K": "TG",
+    "M": "CA",
+    "B": "TCG",
+    "D": "TAG",
+    "H": "TCA",
+    "V": "CAG",
+    "N": "TCAG",
+}
+COMPLEMENT = bytes.maketrans(
+    b"ACGTRYMKBDHVNacgtrymkbdhvn", b"TGCAYRKMVHDBNtgcayrkmvhdbn"
+)
+FASTA_LINE_LENGTH = 70  # as gffread wraps sequences
+SEGMENT_TYPES = ("exon", "CDS")
+
+
+def base_mask_table():
+    """Return 4-bit mask of bases in CODON_BASES of each byte, 0 if none."""
+    table = np.zeros(256, dtype=np.intp)
+    for code, bases in IUPAC_BASES.items():
+        mask = sum(1 << CODON_BASES.index(base) for base in bases)
+        table[ord(code)] = table[ord(code.lower())] = mask
+    return table
+
+
+def amino_acid_table():
+    """Return amino acid of every triple of base masks.
+
+    An ambiguous codon translates to an amino acid only if all codons it
+    may stand for code for that amino acid.
+    """
+    table = np.full(16 ** 3, ord(UNKNOWN_AMINO_ACID), dtype=np.uint8)
+    masks = range(1, 16)
+    for first, second, third in itertools.product(masks, masks, masks):
+        amino_acids = {
+            CODON_TABLE[i * 16 + j * 4 + k]
+            for i, j, k in itertools.product(
+                *(
+                    [b for b in range(4) if mask & (1 << b)]
+                    for mask in (first, second, third)
+                )
+            )
+        }
+        if len(amino_acids) == 1:
+            table[first * 256 + second * 16 + third] = ord(amino_acids.pop())
+    return table
+
+
+BASE_MASK = base_mask_table()
+AMINO_ACIDS = amino_acid_table()
+
+Transcript = namedtuple(
+    "Transcript", ["id", "gene_id", "seqid", "strand", "exons", "cds"]
+)
+TranscriptRecords = namedtuple(  # FASTA records, None without CDS
+    "TranscriptRecords",
+    ["gene_id", "mrna", "cds", "protein", "protein_length"],
+)
+
+
+def translate(cds):
+    """Return protein translation of cds, X for unresolvable codons.
+
+    Stop codons translate as ".", as gffread does by default.
+    """
+    n_codons = len(cds) // 3
+    masks = BASE_MASK[np.frombuffer(cds, dtype=np.uint8, count=3 * n_codons)]
+    codons = masks.reshape(n_codons, 3)
+    return AMINO_ACIDS[
+        codons[:, 0] * 256 + codons[:, 1] * 16 + codons[:, 2]
+    ].tobytes()
+
+
+def reverse_complement(sequence):
+    """Return reverse complement of sequence bytes."""
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def fasta_record(name, sequence):
+    """Return FASTA record bytes of sequence, wrapped in fixed lines."""
+    lines = [b">" + name.encode()]
+    for start in range(0, len(sequence), FASTA_LINE_LENGTH):
+        lines.append(sequence[start : start + FASTA_LINE_LENGTH])
+    lines.append(b"")
+    return b"\n".join(lines)
+
+
+class TranscriptCollector:
+
+    """GFF3 visitor gathering exons and CDS segments of transcripts."""
+
+    def __init__(self):
+        """Initialize empty features and segments."""
+        self.features = {}  # ID -> (line_no, seqid, strand, parent ID)
+        self.segments = {}  # parent ID -> (line_no, seqid, strand, segments)
+
+    def visit(self, fields, line_no):
+        """Record feature, or segment of its parent transcripts."""
+        feature_id, parent_ids = parse_ids(fields[8])
+        if fields[2] in SEGMENT_TYPES:
+            segment = (int(fields[3]) - 1, int(fields[4]), fields[7])
+            for parent_id in parent_ids:
+                if parent_id not in self.segments:
+                    self.segments[parent_id] = (
+                        line_no,
+                        fields[0],
+                        fields[6],
+                        {t: [] for t in SEGMENT_TYPES},
+                    )
+                self.segments[parent_id][3][fields[2]].append(segment)
+        elif feature_id is not None:
+            parent_id = parent_ids[0] if parent_ids else None
+            self.features[feature_id] = (
+                line_no,
+                fields[0],
+                fields[6],
+                parent_id,
+            )
+
+    def finish(self):
+        """Return list of Transcripts in GFF order."""
+        transcripts = []
+        for transcript_id, segments in self.segments.items():
+            line_no, seqid, strand, by_type = segments
+            gene_id = None
+            if transcript_id in self.features:
+                line_no, seqid, strand, gene_id = self.features[
+                    transcript_id
+                ]
+            exons = sorted(by_type["exon"]) or sorted(by_type["CDS"])
+            transcripts.append(
+                (
+                    line_no,
+                    Transcript(
+                        transcript_id,
+                        gene_id or isoform_gene_id(transcript_id),
+                        seqid,
+                        strand,
+                        [(start, end) for start, end, phase in exons],
+                        sorted(by_type["CDS"]),
+                    ),
+                )
+            )
+        transcripts.sort(key=lambda t: t[0])
+        return [transcript for line_no, transcript in transcripts]
+
+
+def isoform_gene_id(record_id):
+    """Return gene ID of a transcript ID ending in an isoform number."""
+    gene_id, sep, isoform = record_id.rpartition(".")
+    if sep and isoform.isdigit():
+        return gene_id
+    return record_id
+
+
+def read_transcripts(gff):
+    """Return list of Transcripts of gff in GFF order."""
+    scan = GffScan(gff)
+    scan.register(TranscriptCollector())
+    return scan.run()[0]
+
+
+def splice(sequence, segments, strand):
+    """Return segments of sequence joined in transcription order.
+
+    Segments are gathered as memoryviews, of the lines of a SequenceView
+    or of bytes, so each base is copied once by the join, and once more
+    only if the strand needs a reverse complement.
+    """
+    if hasattr(sequence, "pieces"):
+        pieces = [
+            piece
+            for start, end, *_ in segments
+            for piece in sequence.pieces(start, end)
+        ]
+    else:
+        view = memoryview(sequence)
+        pieces = [view[start:end] for start, end, *_ in segments]
+    spliced = b"".join(pieces)
+    if strand == "-":
+        return reverse_complement(spliced)
+    return spliced
+
+
+def extract_transcript(transcript, sequence):
+    """Return mRNA, CDS, and protein of transcript, None if no CDS.
+
+    Raises ValueError if a segment ends past the end of sequence.
+    """
+    end = max(segment[1] for segment in transcript.exons + transcript.cds)
+    if end > len(sequence):
+        raise ValueError(
+            f"Transcript {transcript.id} ends at {end}, past the end of"
+            f" {transcript.seqid} ({len(sequence)} bases)"
+        )
+    mrna = splice(sequence, transcript.exons, transcript.strand)
+    if not transcript.cds:
+        return mrna, None, None
+    cds = splice(sequence, transcript.cds, transcript.strand)
+    if transcript.strand == "-":
+        phase = transcript.cds[-1][2]
+    else:
+        phase = transcript.cds[0][2]
+    if phase in ("1", "2"):  # first codon starts within first segment
+        cds = cds[int(phase) :]
+    return mrna, cds, translate(cds)
+
+
+class PrimaryTranscripts:
+
+    """Longest protein of each gene, kept as offset of its FASTA record.
+
+    Only the offset and size of records in the protein output are kept,
+    as in primary_transcript_check; write() copies them in a second pass.
+    """
+
+    def __init__(self):
+        """Initialize with no proteins."""
+        self.longest = {}  # gene ID -> (length, offset, size)
+        self.count = 0
+        self.offset = 0  # of next record in the protein output
+
+    def add(self, gene_id, length, size):
+        """Add record of size bytes, kept if longest of its gene so far."""
+        self.count += 1
+        longest = self.longest.get(gene_id)
+        if longest is None or length > longest[0]:
+            self.longest[gene_id] = (length, self.offset, size)
+        self.offset += size
+
+    def all_primary(self):
+        """Return True if every gene has a single protein."""
+        return len(self.longest) == self.count
+
+    def write(self, proteins, path):
+        """Copy longest proteins from proteins in order of their genes."""
+        with open(proteins, "rb") as in_fh, open(path, "wb") as out_fh:
+            for length, offset, size in self.longest.values():
+                in_fh.seek(offset)
+                out_fh.write(in_fh.read(size))
+
+
+def extract_records(transcripts, genome):
+    """Yield TranscriptRecords of transcripts from an opened genome.
+
+    Exons are sliced from a memory-mapped GenomeAccessor; an IndexedFasta
+    holds the sequence of one seqid at a time in memory.
+    """
+    seqid = None
+    sequence = b""
+    for transcript in transcripts:
+        if transcript.seqid != seqid:
+            seqid = transcript.seqid
+            if seqid not in genome.records:
+                raise ValueError(f"Sequence {seqid} not in {genome.fasta}")
+            sequence = genome.sequence(seqid)
+        mrna, cds, protein = extract_transcript(transcript, sequence)
+        if cds is None:
+            yield TranscriptRecords(
+                transcript.gene_id,
+                fasta_record(transcript.id, mrna),
+                None,
+                None,
+                0,
+            )
+            continue
+        yield TranscriptRecords(
+            transcript.gene_id,
+            fasta_record(transcript.id, mrna),
+            fasta_record(transcript.id, cds),
+            fasta_record(transcript.id, protein),
+            len(protein),
+        )
+
+
+def extract_partition(fasta, transcripts, index=None):
+    """Return list of TranscriptRecords, reading fasta in this process."""
+    with open_genome(fasta, index=index) as genome:
+        return list(extract_records(transcripts, genome))
+
+
+def merge_partitions(transcripts, partitions, submit, jobs):
+    """Yield records of partitions by seqid in order of transcripts.
+
+    partitions maps seqids, in order of their first transcript, to their
+    transcripts; submit(partition) returns a future of its records.  At
+    most jobs + 1 partitions are in flight, and records of a seqid are
+    dropped once written.
+    """
+    remaining = {seqid: len(p) for seqid, p in partitions.items()}
+    unsubmitted = iter(partitions.items())
+    pending = deque()  # (seqid, future) in order of submission
+    records = {}  # seqid -> iterator of records of finished partition
+    for transcript in transcripts:
+        seqid = transcript.seqid
+        while seqid not in records:
+            for next_seqid, partition in itertools.islice(
+                unsubmitted, jobs + 1 - len(pending)
+            ):
+                pending.append((next_seqid, submit(partition)))
+            done_seqid, future = pending.popleft()
+            records[done_seqid] = iter(future.result())
+        yield next(records[seqid])
+        remaining[seqid] -= 1
+        if not remaining[seqid]:
+            del records[seqid]
+
+
+def write_records(records, mrna_fh, cds_fh, pep_fh):
+    """Write TranscriptRecords, returning PrimaryTranscripts of proteins."""
+    primary = PrimaryTranscripts()
+    for record in records:
+        mrna_fh.write(record.mrna)
+        if record.cds is None:
+            continue
+        cds_fh.write(record.cds)
+        pep_fh.write(record.protein)
+        primary.add(
+            record.gene_id, record.protein_length, len(record.protein)
+        )
+    return primary
+
+
+def extract_sequences(
+    transcripts, fasta, mrna_fh, cds_fh, pep_fh, jobs=1, index=None
+):
+    """Write sequences of transcripts from indexed genome fasta.
+
+    Indexes are read from index plus suffix (default: next to fasta).
+    Returns PrimaryTranscripts of the proteins written.  With jobs > 1,
+    transcripts of each seqid are extracted in a process pool, a few
+    seqids ahead of the one being written in GFF order, so outputs do not
+    depend on jobs.
+    """
+    partitions = {}
+    for transcript in transcripts:
+        partitions.setdefault(transcript.seqid, []).append(transcript)
+    if jobs < 2 or len(partitions) < 2:
+        with open_genome(fasta, index=index) as genome:
+            records = extract_records(transcripts, genome)
+            return write_records(records, mrna_fh, cds_fh, pep_fh)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        submit = partial(
+            executor.submit, extract_partition, fasta, index=index
+        )
+        records = merge_partitions(transcripts, partitions, submit, jobs)
+        return write_records(records, mrna_fh, cds_fh, pep_fh)
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""Read and write FASTA sequence names and indexes."""
+# standard library imports
+import mmap
+import re
+import struct
+from collections import namedtuple
+from pathlib import Path
+
+# third-party imports
+import numpy as np
+
+# module imports
+from .bgzf import BGZF_READ_SIZE
+from .bgzf import block_size
+from .bgzf import inflate_blocks
+from .bgzf import is_bgzf
+from .bgzf import is_gzipped
+from .bgzf import open_input
+from .common import FASTA_BLOCK_SIZE
+from .common import next_fasta_header
+
+# global constants
+FAI_SUFFIX = ".fai"
+GZI_SUFFIX = ".gzi"
+FASTA_NAME_RE = re.compile(rb">[^\S\n]*(\S*)")  # as samtools reads names
+
+FaiRecord = namedtuple(
+    "FaiRecord", ["name", "length", "offset", "line_bases", "line_width"]
+)
+
+
+def fai_path(fasta):
+    """Return path of samtools faidx index of fasta."""
+    return Path(f"{fasta}{FAI_SUFFIX}")
+
+
+def gzi_path(fasta):
+    """Return path of bgzip index of fasta."""
+    return Path(f"{fasta}{GZI_SUFFIX}")
+
+
+def read_fai(path):
+    """Yield FaiRecords from a .fai file."""
+    with Path(path).open("rt") as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+            yield FaiRecord(
+                fields[0],
+                int(fields[1]),
+                int(fields[2]),
+                int(fields[3]),
+                int(fields[4]),
+            )
+
+
+def write_fai(records, path):
+    """Write FaiRecords to a .fai file."""
+    with Path(path).open("wt") as fh:
+        for record in records:
+            fh.write("\t".join(str(field) for field in record) + "\n")
+
+
+def graph_table():
+    """Return True for bytes that C isgraph() counts as sequence."""
+    table = np.zeros(256, dtype=bool)
+    table[ord("!") : ord("~") + 1] = True
+    return table
+
+
+IS_GRAPH = graph_table()
+
+
+class FaiBuilder:
+
+    """Build a .fai index from FASTA data fed block by block.
+
+    Follows the checks and quirks of samtools faidx: lines are compared
+    by width including line ends, a sequence ends at its first short or
+    empty line, sequence bases are the printable bytes of its lines, and
+    headers without sequence and duplicate names are left out.  Lines of
+    a sequence are handled as runs of equal width with NumPy, so only
+    headers and the lines where widths change are visited in Python.
+    """
+
+    def __init__(self):
+        """Start outside any record."""
+        self.records = []
+        self.names = set()
+        self.record = None  # [name, length, offset, line_bases, line_width]
+        self.in_sequence = False  # lines are part of a sequence
+        self.read_done = False  # current record has a sequence line
+        self.tail = []  # pieces of incomplete last line of previous blocks
+        self.offset = 0  # offset in uncompressed data of tail
+        self.line_no = 0  # lines before tail
+
+    def add_block(self, block, final=False):
+        """Index the complete lines of block, or all of it if final."""
+        if not final and block.find(b"\n") == -1:  # line continues
+            self.tail.append(block)
+            return
+        data = b"".join(self.tail + [block]) if self.tail else block
+        array = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(array == ord("\n"))
+        if final and len(data) and data[-1:] != b"\n":
+            ends = np.append(ends, len(data))  # as if newline-terminated
+        n_used = int(ends[-1]) + 1 if len(ends) else 0
+        self.tail = [data[n_used:]] if n_used < len(data) else []
+        if len(ends):
+            self._add_lines(data, array[:n_used], ends)
+        self.offset += n_used
+        self.line_no += len(ends)
+
+    def _add_lines(self, data, array, ends):
+        """Index the lines ending at ends, visiting runs of equal width."""
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        widths = ends - starts + 1
+        not_graph = np.flatnonzero(~IS_GRAPH[array] & (array != ord("\n")))
+        bases = widths - 1
+        if len(not_graph):
+            bases -= np.bincount(
+                np.searchsorted(ends, not_graph), minlength=len(ends)
+            )
+        is_header = np.zeros(len(ends), dtype=bool)
+        is_header[widths > 1] = array[starts[widths > 1]] == ord(">")
+        run_starts = np.ones(len(ends), dtype=bool)
+        run_starts[1:] = (
+            is_header[1:] | is_header[:-1] | (widths[1:] != widths[:-1])
+        )
+        run_starts = np.flatnonzero(run_starts)
+        run_ends = np.append(run_starts[1:], len(ends))
+        base_sums = np.add.reduceat(bases, run_starts)
+        for first, last, base_sum in zip(
+            run_starts.tolist(), run_ends.tolist(), base_sums.tolist()
+        ):
+            start = int(starts[first])
+            end = int(ends[first])
+            line_no = self.line_no + first + 1
+            if is_header[first]:
+                self._start_record(data[start + 1 : end], end + 1)
+                continue
+            width = int(widths[first])
+            if not self.in_sequence:
+                self._check_blank(data, starts[first:last], width, line_no)
+            elif width == 1:  # empty line ends the sequence
+                self.in_sequence = False
+            elif not self.record[4] or width == self.record[4]:
+                if not self.record[4]:
+                    self.record[3] = int(bases[first])
+                    self.record[4] = width
+                self.record[1] += base_sum
+                self.read_done = True
+            elif width > self.record[4]:
+                raise ValueError(
+                    f"Different line length in sequence {self.record[0]}"
+                    f" at line {line_no}"
+                )
+            else:  # short line ends the sequence
+                self.record[1] += int(bases[first])
+                self.read_done = True
+                self.in_sequence = False
+                self._check_blank(
+                    data, starts[first + 1 : last], width, line_no + 1
+                )
+
+    def _check_blank(self, data, starts, width, line_no):
+        """Raise ValueError unless lines outside sequences are empty."""
+        if width == 1 or not len(starts):
+            return
+        for index, start in enumerate(starts.tolist()):
+            if width != 2 or data[start : start + 1] != b"\r":
+                character = data[start : start + 1].decode(errors="replace")
+                if character == "\r":
+                    raise ValueError(
+                        "Carriage return not followed by new line"
+                        f" at line {line_no + index}"
+                    )
+                raise ValueError(
+                    f'Unexpected "{character}" at line {line_no + index}'
+                )
+
+    def _start_record(self, header, offset):
+        """Finish current record and start one named in header."""
+        self._finish_record()
+        fields = header.split(None, 1)
+        name = fields[0].decode() if fields else ""
+        self.record = [name, 0, self.offset + offset, 0, 0]
+        self.in_sequence = True
+        self.read_done = False
+
+    def _finish_record(self):
+        """Keep current record if it has sequence and a new name."""
+        if self.read_done and self.record[0] not in self.names:
+            self.records.append(FaiRecord(*self.record))
+            self.names.add(self.record[0])
+        self.read_done = False
+
+    def finish(self):
+        """Return list of FaiRecords.
+
+        Raises ValueError if the last header has no sequence.
+        """
+        self.add_block(b"", final=True)
+        if not self.read_done:
+            raise ValueError(f"File truncated at line {self.line_no}")
+        self._finish_record()
+        return self.records
+
+
+def build_fai(fasta, block_size=FASTA_BLOCK_SIZE):
+    """Return FaiRecords of plain or BGZF fasta, as samtools faidx does.
+
+    Offsets of BGZF files are in the uncompressed data.  Raises
+    ValueError if fasta is not in a format samtools can index.
+    """
+    builder = FaiBuilder()
+    with open_input(fasta, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            builder.add_block(block)
+    return builder.finish()
+
+
+def build_gzi(fasta):
+    """Return compressed and uncompressed offsets of BGZF blocks of fasta.
+
+    Offsets are those of blocks holding data, as read_gzi returns them.
+    """
+    compressed = []
+    uncompressed = []
+    compressed_offset = uncompressed_offset = 0
+    raw = b""
+    with open(fasta, "rb") as fh:
+        for chunk in iter(lambda: fh.read(BGZF_READ_SIZE), b""):
+            raw = raw + chunk if raw else chunk
+            pos = 0
+            while True:
+                size = block_size(raw, pos)
+                if size is None or pos + size > len(raw):
+                    break
+                (isize,) = struct.unpack_from("<I", raw, pos + size - 4)
+                if isize:
+                    compressed.append(compressed_offset)
+                    uncompressed.append(uncompressed_offset)
+                compressed_offset += size
+                uncompressed_offset += isize
+                pos += size
+            raw = raw[pos:]
+    if raw:
+        raise OSError(f"{fasta} ends in a truncated block")
+    return (
+        np.array(compressed, dtype=np.int64),
+        np.array(uncompressed, dtype=np.int64),
+    )
+
+
+def write_gzi(blocks, path):
+    """Write offsets of BGZF blocks but the first to a .gzi file."""
+    compressed, uncompressed = blocks
+    keep = compressed != 0
+    offsets = np.column_stack((compressed[keep], uncompressed[keep]))
+    with Path(path).open("wb") as fh:
+        fh.write(struct.pack("<Q", len(offsets)))
+        fh.write(offsets.astype("<u8").tobytes())
+
+
+def write_indexes(fasta, index=None):
+    """Write .fai index of fasta, and .gzi index if it is BGZF.
+
+    Indexes are written to index plus suffix (default: next to fasta).
+    Raises ValueError if fasta cannot be indexed.
+    """
+    index = index or fasta
+    if is_gzipped(fasta) and not is_bgzf(fasta):
+        raise ValueError("gzip files must be recompressed with bgzip")
+    if is_bgzf(fasta):
+        write_gzi(build_gzi(fasta), gzi_path(index))
+    write_fai(build_fai(fasta), fai_path(index))
+
+
+def read_gzi(path):
+    """Return compressed and uncompressed offsets of BGZF blocks.
+
+    The first block, at offset 0 in both, is not listed in .gzi files
+    but is included here.
+    """
+    data = Path(path).read_bytes()
+    (n_blocks,) = struct.unpack_from("<Q", data)
+    offsets = np.frombuffer(data, dtype="<u8", count=2 * n_blocks, offset=8)
+    offsets = offsets.reshape(n_blocks, 2).astype(np.int64)
+    compressed = np.concatenate(([0], offsets[:, 0]))
+    uncompressed = np.concatenate(([0], offsets[:, 1]))
+    return compressed, uncompressed
+
+
+def index_is_current(fasta):
+    """Return True if fasta has an index no older than itself.
+
+    Compressed FASTA must be BGZF with both .fai and .gzi indexes.
+    """
+    fasta = Path(fasta)
+    indexes = [fai_path(fasta)]
+    if is_gzipped(fasta):
+        if not is_bgzf(fasta):
+            return False
+        indexes.append(gzi_path(fasta))
+    fasta_mtime = fasta.stat().st_mtime
+    for index in indexes:
+        if not index.is_file() or index.stat().st_mtime < fasta_mtime:
+            return False
+    return fai_path(fasta).stat().st_size > 0
+
+
+def scan_headers(fasta, block_size=FASTA_BLOCK_SIZE):
+    """Yield sequence names of fasta by scanning blocks for headers.
+
+    Only header names are decoded; sequence lines are skipped by
+    searching each block for newlines followed by ">".
+    """
+    pending = b""  # header name cut off at end of block
+    at_line_start = True
+    with open_input(fasta, "rb") as fh:
+        while True:
+            data = fh.read(block_size)
+            if not data:
+                break
+            block = pending + data if pending else data
+            pending = b""
+            if at_line_start and block.startswith(b">"):
+                header_pos = 0
+            else:
+                header_pos = next_fasta_header(block, 0)
+            while header_pos != -1:
+                name = FASTA_NAME_RE.match(block, header_pos)
+                if name.end() == len(block):  # may continue in next block
+                    pending = block[header_pos:]
+                    break
+                yield name.group(1).decode()
+                header_pos = next_fasta_header(block, name.end())
+            at_line_start = bool(pending) or block.endswith(b"\n")
+    if pending:
+        yield FASTA_NAME_RE.match(pending).group(1).decode()
+
+
+class HeaderSource:
+
+    """Sequence names of a FASTA file, read from its index if current.
+
+    Iterating yields names in file order, from the .fai (plus .gzi for
+    bgzip-compressed files) when the index is no older than the FASTA,
+    otherwise by scanning the file for header lines.  Whitespace after
+    ">" is skipped, as samtools does, and an empty name is yielded for a
+    header without one.
+    """
+
+    def __init__(self, fasta):
+        """Choose index or scan as source of names of fasta."""
+        self.fasta = Path(fasta)
+        if index_is_current(self.fasta):
+            self.source = str(fai_path(self.fasta))
+        else:
+            self.source = None
+
+    def __iter__(self):
+        """Yield sequence names."""
+        if self.source is not None:
+            return (record.name for record in read_fai(self.source))
+        return scan_headers(self.fasta)
+
+    def __repr__(self):
+        """Describe where names come from."""
+        if self.source is None:
+            return f"headers scanned from {self.fasta}"
+        return f"index {self.source}"
+
+
+class IndexedFasta:
+
+    """Random access to sequences of a FASTA file with a current index.
+
+    Plain files are read at the offsets in their .fai index.  For
+    bgzip-compressed files, only the blocks holding the requested range,
+    found with the .gzi index, are inflated.
+    """
+
+    def __init__(self, fasta, index=None):
+        """Read indexes of fasta, at index if given, and open fasta."""
+        self.fasta = Path(fasta)
+        index = index or self.fasta
+        self.records = {r.name: r for r in read_fai(fai_path(index))}
+        self.blocks = None
+        if is_bgzf(self.fasta):
+            self.blocks = read_gzi(gzi_path(index))
+        self._fh = self.fasta.open("rb")
+
+    def __enter__(self):
+        """Return self as context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the FASTA file."""
+        self.close()
+
+    def close(self):
+        """Close the FASTA file."""
+        self._fh.close()
+
+    def _read(self, offset, size):
+        """Return size uncompressed bytes starting at offset."""
+        if self.blocks is None:
+            self._fh.seek(offset)
+            return self._fh.read(size)
+        compressed, uncompressed = self.blocks
+        first = int(np.searchsorted(uncompressed, offset, side="right")) - 1
+        last = int(np.searchsorted(uncompressed, offset + size))
+        self._fh.seek(compressed[first])
+        if last < len(compressed):
+            raw = self._fh.read(int(compressed[last] - compressed[first]))
+        else:
+            raw = self._fh.read()
+        blocks = []
+        pos = 0
+        while pos < len(raw):
+            size_of_block = block_size(raw, pos)
+            if size_of_block is None:
+                break
+            blocks.append(raw[pos : pos + size_of_block])
+            pos += size_of_block
+        skip = offset - int(uncompressed[first])
+        return inflate_blocks(blocks)[skip : skip + size]
+
+    def fetch(self, name, start=0, end=None):
+        """Return sequence of name from 0-based start to exclusive end."""
+        record = self.records[name]
+        if end is None or end > record.length:
+            end = record.length
+        if start >= end:
+            return b""
+        raw_offsets = []
+        for position in (start, end):
+            line, column = divmod(position, record.line_bases)
+            raw_offsets.append(
+                record.offset + line * record.line_width + column
+            )
+        raw = self._read(raw_offsets[0], raw_offsets[1] - raw_offsets[0])
+        return raw.translate(None, b"\r\n")
+
+    def sequence(self, name):
+        """Return sequence of name, to be sliced by 0-based positions."""
+        return self.fetch(name)
+
+
+class GenomeAccessor:
+
+    """Memory-mapped access to sequences of an uncompressed, indexed FASTA.
+
+    Slices come back as memoryviews of the mapped file, so no sequence
+    bytes are copied unless a range spans lines and must be joined;
+    SequenceView.pieces() gives the line pieces of any range uncopied.
+    Views must be released before the accessor is closed.
+    """
+
+    def __init__(self, fasta, index=None):
+        """Read .fai index of fasta, at index if given, and map fasta."""
+        self.fasta = Path(fasta)
+        index = index or self.fasta
+        self.records = {r.name: r for r in read_fai(fai_path(index))}
+        with self.fasta.open("rb") as fh:
+            if self.fasta.stat().st_size:
+                self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            else:  # empty files cannot be mapped
+                self._map = b""
+        self._view = memoryview(self._map)
+
+    def __enter__(self):
+        """Return self as context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Unmap the FASTA file."""
+        self.close()
+
+    def close(self):
+        """Unmap the FASTA file."""
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def lines(self, name, start=0, end=None):
+        """Yield memoryviews of the line pieces of name from start to end."""
+        record = self.records[name]
+        if end is None or end > record.length:
+            end = record.length
+        position = start
+        while position < end:
+            line, column = divmod(position, record.line_bases)
+            n_bases = min(record.line_bases - column, end - position)
+            offset = record.offset + line * record.line_width + column
+            if offset + n_bases > len(self._view):
+                raise OSError(f"{self.fasta} is shorter than its index")
+            yield self._view[offset : offset + n_bases]
+            position += n_bases
+
+    def fetch(self, name, start=0, end=None):
+        """Return memoryview of name from 0-based start to exclusive end.
+
+        Ranges within one line are not copied; use lines() to get the
+        pieces of longer ranges without copying.
+        """
+        pieces = list(self.lines(name, start, end))
+        if len(pieces) == 1:
+            return pieces[0]
+        return memoryview(b"".join(pieces))
+
+    def sequence(self, name):
+        """Return SequenceView of name, to be sliced by 0-based positions."""
+        if name not in self.records:
+            raise KeyError(name)
+        return SequenceView(self, name)
+
+
+class SequenceView:
+
+    """One sequence of a GenomeAccessor, sliced without reading it all."""
+
+    def __init__(self, genome, name):
+        """Refer to sequence name of genome."""
+        self.genome = genome
+        self.name = name
+
+    def __len__(self):
+        """Return length of the sequence."""
+        return self.genome.records[self.name].length
+
+    def pieces(self, start, end):
+        """Return list of uncopied memoryviews of bases start to end."""
+        return list(self.genome.lines(self.name, start, end))
+
+    def __getitem__(self, key):
+        """Return memoryview of a slice with unit step."""
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("sequences are sliced with unit step only")
+        start, stop, step = key.indices(len(self))
+        return self.genome.fetch(self.name, start, stop)
+
+
+def open_genome(fasta, index=None):
+    """Return GenomeAccessor or, if compressed, IndexedFasta of fasta.
+
+    Indexes are read from index plus suffix (default: next to fasta).
+    """
+    if is_gzipped(fasta):
+        return IndexedFasta(fasta, index=index)
+    return GenomeAccessor(fasta, index=index)
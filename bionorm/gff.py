@@ -0,0 +1,577 @@
+# -*- coding: utf-8 -*-
+"""Rank, sort, scan, and rewrite GFF3 features."""
+
+# standard library imports
+import heapq
+import mmap
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from pathlib import Path
+
+# third-party imports
+import numpy as np
+
+# module imports
+from .bgzf import open_input
+
+# global constants
+MEGABYTE = 1024 * 1024
+MAX_MERGE_RUNS = 128  # run files open at once while merging
+UNRANKED = 1000  # rank of types outside the hierarchy, sorted last
+MIN_TABLE_FRACTION = 0.125  # of max_memory left for the sort table
+
+
+def parse_ids(attributes):
+    """Return ID (or None) and tuple of Parent IDs from attributes column.
+
+    Keys are matched with surrounding whitespace stripped, as in "; ID=".
+    """
+    feature_id = None
+    parent_ids = ()
+    for pair in attributes.split(";"):
+        key, sep, value = pair.partition("=")
+        if not sep:
+            continue
+        key = key.strip()
+        if key == "ID":
+            feature_id = value
+        elif key == "Parent":
+            parent_ids = tuple(value.split(","))
+    return feature_id, parent_ids
+
+
+class TypeHierarchy:
+
+    """Rank feature types so that parent types precede child types.
+
+    Features are added by ID with their type and parent IDs.  rank()
+    derives parent/child relations among types and ranks them
+    topologically in O(types + edges): types without parent types get
+    rank 1, other types one more than their highest-ranked parent type.
+    Types in (or below) a cycle cannot be ranked and are listed in
+    cyclic_types; line numbers of features with parent IDs not found
+    among the features are listed in missing_parents, and those parents
+    are ignored.
+
+    Only type-to-type edges are needed for ranking, so IDs are kept as
+    64-bit hashes in arrays, about 20 bytes per feature, until rank()
+    resolves parent references.  If two IDs share a hash (vanishingly
+    unlikely), an extra edge between their types may be derived.
+    """
+
+    def __init__(self):
+        """Initialize empty hierarchy."""
+        self.type_codes = {}  # feature type -> code, in order of first use
+        self.ranks = {}
+        self.cyclic_types = []
+        self.missing_parents = []
+        self._id_hashes = array("q")
+        self._id_types = array("i")
+        self._parent_hashes = array("q")  # one per parent reference
+        self._child_types = array("i")
+        self._child_lines = array("q")
+
+    @property
+    def nbytes(self):
+        """Return size of hierarchy storage in bytes."""
+        return sum(
+            len(column) * column.itemsize
+            for column in (
+                self._id_hashes,
+                self._id_types,
+                self._parent_hashes,
+                self._child_types,
+                self._child_lines,
+            )
+        )
+
+    def add_feature(self, feature_id, feature_type, parent_ids, line_no=0):
+        """Add a feature with its type and tuple of parent IDs."""
+        type_code = self.type_codes.setdefault(
+            feature_type, len(self.type_codes)
+        )
+        self._id_hashes.append(hash(feature_id))
+        self._id_types.append(type_code)
+        for parent_id in parent_ids:
+            self._parent_hashes.append(hash(parent_id))
+            self._child_types.append(type_code)
+            self._child_lines.append(line_no)
+
+    def parent_types(self):
+        """Return dictionary of parent types of each type."""
+        types = list(self.type_codes)
+        id_types = np.frombuffer(self._id_types, dtype=np.int32)
+        parent_types = {types[code]: set() for code in np.unique(id_types)}
+        if not len(self._parent_hashes):
+            return parent_types
+        id_hashes = np.frombuffer(self._id_hashes, dtype=np.int64)
+        order = np.argsort(id_hashes, kind="stable")
+        sorted_hashes = id_hashes[order]
+        parent_hashes = np.frombuffer(self._parent_hashes, dtype=np.int64)
+        # last of duplicate IDs wins, as in a dictionary
+        positions = np.searchsorted(sorted_hashes, parent_hashes, "right") - 1
+        found = positions >= 0
+        found[found] = sorted_hashes[positions[found]] == parent_hashes[found]
+        self.missing_parents = sorted(
+            set(np.frombuffer(self._child_lines, dtype=np.int64)[~found])
+        )
+        parent_codes = id_types[order[positions[found]]]
+        child_codes = np.frombuffer(self._child_types, dtype=np.int32)[found]
+        edges = np.unique(
+            parent_codes.astype(np.int64) * len(types) + child_codes
+        )
+        for parent_code, child_code in zip(*divmod(edges, len(types))):
+            if parent_code != child_code:  # nesting is not a cycle
+                parent_types[types[child_code]].add(types[parent_code])
+        return parent_types
+
+    def rank(self):
+        """Rank types and return dictionary of ranks."""
+        parent_types = self.parent_types()
+        children = {t: [] for t in parent_types}
+        n_unranked_parents = {}
+        for feature_type, parents in parent_types.items():
+            n_unranked_parents[feature_type] = len(parents)
+            for parent in parents:
+                children[parent].append(feature_type)
+        ranks = {t: 1 for t, n in n_unranked_parents.items() if not n}
+        queue = deque(ranks)
+        while queue:
+            parent = queue.popleft()
+            for child in children[parent]:
+                n_unranked_parents[child] -= 1
+                if not n_unranked_parents[child]:
+                    ranks[child] = 1 + max(
+                        ranks[t] for t in parent_types[child]
+                    )
+                    queue.append(child)
+        self.cyclic_types = sorted(
+            t for t, n in n_unranked_parents.items() if n
+        )
+        self.ranks = ranks
+        return ranks
+
+    def type_rank(self, feature_type):
+        """Return rank of feature_type, UNRANKED if it has none."""
+        return self.ranks.get(feature_type, UNRANKED)
+
+
+class GffScan:
+
+    """Read a GFF3 file once, passing each feature to registered visitors.
+
+    A visitor has visit(fields, line_no), called with the tab-split
+    columns and file line number of every feature line, and finish(),
+    called after the last line.  However many checks and statistics are
+    registered, the file is decompressed and split only once.
+    """
+
+    def __init__(self, path):
+        """Set GFF3 path (plain, gzip, or bgzip)."""
+        self.path = path
+        self.visitors = []
+
+    def register(self, visitor):
+        """Add visitor and return it."""
+        self.visitors.append(visitor)
+        return visitor
+
+    def run(self):
+        """Scan file and return list of finish() results of visitors."""
+        visits = [visitor.visit for visitor in self.visitors]
+        with open_input(self.path, "rt") as gff_fh:
+            for line_no, line in enumerate(gff_fh, 1):
+                if line.startswith("#") or line.isspace() or not line:
+                    continue
+                fields = line.rstrip().split("\t")
+                for visit in visits:
+                    visit(fields, line_no)
+        return [visitor.finish() for visitor in self.visitors]
+
+
+class FeatureCounter:
+
+    """Count features by type."""
+
+    def __init__(self):
+        """Initialize empty counts."""
+        self.counts = {}
+
+    def visit(self, fields, line_no):
+        """Count feature."""
+        feature_type = fields[2]
+        self.counts[feature_type] = self.counts.get(feature_type, 0) + 1
+
+    def finish(self):
+        """Return dictionary of counts by type."""
+        return self.counts
+
+
+class FeatureOrderChecker:
+
+    """Check that GFF3 features are in data store order.
+
+    Each seqid must be contiguous, starts must not decrease within a seqid,
+    and features with equal starts must be in order of type rank.  Lines
+    are visited one by one; ties are checked by finish() once all types
+    are known.
+    """
+
+    def __init__(self):
+        """Initialize empty checker."""
+        self.hierarchy = TypeHierarchy()
+        self.errors = []  # (line number, message)
+        self._seen_seqids = set()
+        self._previous = None  # (seqid, start, type) of previous feature
+        self._ties = []  # (previous type, type, line number) at same start
+
+    def visit(self, fields, line_no):
+        """Add a feature line split into fields."""
+        seqid, feature_type, start = fields[0], fields[2], int(fields[3])
+        if len(fields) > 8:
+            feature_id, parent_ids = parse_ids(fields[8])
+            if feature_id is not None:
+                self.hierarchy.add_feature(
+                    feature_id, feature_type, parent_ids, line_no
+                )
+        previous = self._previous
+        if previous is None or seqid != previous[0]:
+            if seqid in self._seen_seqids:
+                self.errors.append(
+                    (line_no, f"seqid {seqid} is not contiguous")
+                )
+            self._seen_seqids.add(seqid)
+        elif start < previous[1]:
+            self.errors.append(
+                (line_no, f"start {start} precedes start {previous[1]}")
+            )
+        elif start == previous[1] and feature_type != previous[2]:
+            self._ties.append((previous[2], feature_type, line_no))
+        self._previous = (seqid, start, feature_type)
+
+    def finish(self):
+        """Rank types, check ties, and return True if order is correct."""
+        self.hierarchy.rank()
+        type_rank = self.hierarchy.type_rank
+        for previous_type, feature_type, line_no in self._ties:
+            if type_rank(feature_type) < type_rank(previous_type):
+                self.errors.append(
+                    (line_no, f"{feature_type} must precede {previous_type}")
+                )
+        self.errors.sort()
+        return not self.errors
+
+
+def prefix_attributes(attributes, feature_prefix, prefix_name=False):
+    """Return GFF3 attributes column with ID and Parent values prefixed.
+
+    The column is split once into key=value pairs and only the values of
+    ID, Parent, and (if prefix_name is set) Name are rewritten.  Keys are
+    matched as in parse_ids and written back unchanged.
+    """
+    pairs = attributes.split(";")
+    for i, pair in enumerate(pairs):
+        key, sep, value = pair.partition("=")
+        if not sep:
+            continue
+        name = key.strip()
+        if name == "ID" or (name == "Name" and prefix_name):
+            pairs[i] = f"{key}={feature_prefix}.{value}"
+        elif name == "Parent":
+            pairs[i] = f"{key}=" + ",".join(
+                f"{feature_prefix}.{parent}" for parent in value.split(",")
+            )
+    return ";".join(pairs)
+
+
+def rewrite_feature(
+    fields, seqid_prefix=None, feature_prefix=None, prefix_name=False
+):
+    """Return output line of a feature, prefixed if seqid_prefix is given."""
+    if seqid_prefix is None:
+        return "\t".join(fields) + "\n"
+    if len(fields) > 8:  # set new ID, parent IDs, and name if flag set
+        fields[8] = prefix_attributes(fields[8], feature_prefix, prefix_name)
+    return seqid_prefix + "\t".join(fields) + "\n"
+
+
+def _rewrite_partition(rewrite, text_path, bounds, starts, ranks):
+    """Return rewritten text of one seqid's lines sorted by start and rank.
+
+    Lines are read from text_path at the (start, end) byte offsets in
+    bounds, so that only offsets are sent to worker processes.
+    """
+    with open(text_path, "rb") as fh, mmap.mmap(
+        fh.fileno(), 0, access=mmap.ACCESS_READ
+    ) as text:
+        return "".join(
+            rewrite(text[start:end].decode().split("\t"))
+            for start, end in bounds[np.lexsort((ranks, starts))].tolist()
+        )
+
+
+class FeatureTable:
+
+    """Compact columnar store of GFF3 feature lines.
+
+    Seqids and feature types are interned as integer codes, starts and
+    line offsets are held in arrays, and the text of all lines is kept in
+    one byte buffer.
+    """
+
+    def __init__(self):
+        """Initialize empty table."""
+        self.seqid_codes = {}  # seqid -> code, in order of first use
+        self.type_codes = {}  # feature type -> code, in order of first use
+        self._seqids = array("i")
+        self._types = array("i")
+        self._starts = array("q")
+        self._offsets = array("q", [0])
+        self._text = bytearray()
+
+    def __len__(self):
+        """Return number of features."""
+        return len(self._starts)
+
+    @property
+    def nbytes(self):
+        """Return size of table storage in bytes."""
+        return len(self._text) + sum(
+            len(column) * column.itemsize
+            for column in (
+                self._seqids,
+                self._types,
+                self._starts,
+                self._offsets,
+            )
+        )
+
+    def add(self, line, fields):
+        """Add a feature line and its fields."""
+        seqid_code = self.seqid_codes.setdefault(
+            fields[0], len(self.seqid_codes)
+        )
+        type_code = self.type_codes.setdefault(fields[2], len(self.type_codes))
+        self._seqids.append(seqid_code)
+        self._types.append(type_code)
+        self._starts.append(int(fields[3]))
+        self._text += line.encode()
+        self._offsets.append(len(self._text))
+
+    def line(self, index):
+        """Return text of line at index."""
+        return self._text[
+            self._offsets[index] : self._offsets[index + 1]
+        ].decode()
+
+    @staticmethod
+    def _sorted_code_positions(codes):
+        """Return array mapping each code to sorted position of its name."""
+        names = list(codes)
+        order = sorted(range(len(names)), key=names.__getitem__)
+        positions = np.empty(len(names), dtype=np.int64)
+        positions[order] = np.arange(len(names))
+        return positions
+
+    def _seqid_keys(self):
+        """Return array of seqid sort positions of all features."""
+        return self._sorted_code_positions(self.seqid_codes)[
+            np.frombuffer(self._seqids, dtype=np.int32)
+        ]
+
+    def _type_ranks(self, rank):
+        """Return array of type ranks of all features."""
+        type_ranks = np.array([rank(t) for t in self.type_codes])
+        return type_ranks[np.frombuffer(self._types, dtype=np.int32)]
+
+    def argsort(self, rank=None):
+        """Return indices sorting features by seqid, start, and type rank.
+
+        Without rank, sort by seqid and start only.  The sort is stable.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        starts = np.frombuffer(self._starts, dtype=np.int64)
+        keys = [starts, self._seqid_keys()]
+        if rank is not None:
+            keys.insert(0, self._type_ranks(rank))
+        return np.lexsort(keys)
+
+    def write_text(self, path):
+        """Write text of all lines to path, at their offsets in the table."""
+        with open(path, "wb") as fh:
+            fh.write(self._text)
+
+    def partitions(self, rank):
+        """Yield (bounds, starts, ranks) of each seqid in sorted seqid order.
+
+        bounds holds the (start, end) offsets of lines in the text, as
+        written by write_text(); lines of a partition are in input order.
+        """
+        if not len(self):
+            return
+        seqid_keys = self._seqid_keys()
+        order = np.argsort(seqid_keys, kind="stable")
+        bounds = np.flatnonzero(np.diff(seqid_keys[order])) + 1
+        starts = np.frombuffer(self._starts, dtype=np.int64)
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        type_ranks = self._type_ranks(rank)
+        for indices in np.split(order, bounds):
+            yield (
+                np.column_stack((offsets[indices], offsets[indices + 1])),
+                starts[indices],
+                type_ranks[indices],
+            )
+
+
+class FeatureSorter:
+
+    """Sort GFF3 feature lines by seqid, start, and feature-type rank.
+
+    Features are held in a FeatureTable unless max_memory (in MB) is set.
+    Then the table is sorted and spilled to a run file in tmpdir whenever
+    its size exceeds max_memory, and the runs are k-way merged.  Ties keep
+    input order, so all modes give identical output.
+
+    The size of a TypeHierarchy filled alongside counts against
+    max_memory too.  It cannot be spilled, so once it takes up most of
+    max_memory the table is still allowed MIN_TABLE_FRACTION of it.
+    """
+
+    def __init__(self, max_memory=None, tmpdir=None, hierarchy=None):
+        """Initialize empty table."""
+        if max_memory is None:
+            self.max_bytes = None
+        else:
+            self.max_bytes = max_memory * MEGABYTE
+        self.tmpdir = tmpdir
+        self.hierarchy = hierarchy
+        self.n_features = 0
+        self._table = FeatureTable()
+        self._table_start = 0  # input index of first feature in table
+        self._run_dir = None
+        self._runs = []
+        self._n_run_files = 0
+
+    def __enter__(self):
+        """Use as context manager so run files get removed."""
+        return self
+
+    def __exit__(self, *args):
+        """Remove run files."""
+        self.close()
+
+    def add(self, line, fields):
+        """Add a feature line and its fields."""
+        self._table.add(line, fields)
+        self.n_features += 1
+        if self.max_bytes is None:
+            return
+        table_bytes = self.max_bytes
+        if self.hierarchy is not None:
+            table_bytes = max(
+                table_bytes - self.hierarchy.nbytes,
+                int(table_bytes * MIN_TABLE_FRACTION),
+            )
+        if self._table.nbytes > table_bytes:
+            self._spill()
+
+    def _spill(self):
+        """Sort table by position and write it to a new run file."""
+        if not len(self._table):
+            return
+        table = self._table
+        self._write_run(
+            (None, None, self._table_start + i, table.line(i).split("\t"))
+            for i in table.argsort()
+        )
+        self._table = FeatureTable()
+        self._table_start = self.n_features
+
+    def _run_path(self, name):
+        """Return path of name in the run directory, made on first use."""
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(
+                prefix="gff_sort_", dir=self.tmpdir
+            )
+        return Path(self._run_dir.name) / name
+
+    def _write_run(self, entries):
+        """Write position-sorted entries to a new run file."""
+        run_path = self._run_path(f"run_{self._n_run_files}.tsv")
+        self._n_run_files += 1
+        with run_path.open("w") as run_fh:
+            for _seqid, _start, index, fields in entries:
+                run_fh.write(f"{index}\t" + "\t".join(fields) + "\n")
+        self._runs.append(run_path)
+
+    @staticmethod
+    def _read_run(run_path):
+        """Yield (seqid, start, index, fields) entries from a run file."""
+        with run_path.open("r") as run_fh:
+            for line in run_fh:
+                fields = line.rstrip("\n").split("\t")
+                index = int(fields.pop(0))
+                yield fields[0], int(fields[3]), index, fields
+
+    def sorted_features(self, rank):
+        """Yield fields of every feature in sorted order.
+
+        rank is a function returning the rank of a feature type.
+        """
+        if not self._runs:
+            table = self._table
+            for i in table.argsort(rank):
+                yield table.line(i).split("\t")
+            return
+        self._spill()
+        while len(self._runs) > MAX_MERGE_RUNS:  # merge runs in batches
+            batch = self._runs[:MAX_MERGE_RUNS]
+            self._runs = self._runs[MAX_MERGE_RUNS:]
+            self._write_run(heapq.merge(*[self._read_run(p) for p in batch]))
+            for run_path in batch:
+                run_path.unlink()
+        merged = heapq.merge(*[self._read_run(p) for p in self._runs])
+        for _position, group in groupby(merged, key=lambda f: f[:2]):
+            for _seqid, _start, _index, fields in sorted(
+                group, key=lambda f: rank(f[3][2])
+            ):
+                yield fields
+
+    def sorted_lines(self, rank, rewrite=rewrite_feature, jobs=1):
+        """Yield text of every feature in sorted order, as rewritten.
+
+        rewrite is a picklable function taking the fields of a feature.  If
+        jobs > 1 and no runs were spilled, each seqid is sorted and rewritten
+        in a pool of jobs processes, which read the lines from a copy of
+        the table text in the run directory.
+        """
+        if jobs < 2 or self._runs or not len(self._table):
+            for fields in self.sorted_features(rank):
+                yield rewrite(fields)
+            return
+        text_path = self._run_path("table.txt")
+        self._table.write_text(text_path)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            pending = deque()
+            for partition in self._table.partitions(rank):
+                pending.append(
+                    pool.submit(
+                        _rewrite_partition, rewrite, text_path, *partition
+                    )
+                )
+                if len(pending) > 2 * jobs:  # bound partitions in flight
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        """Drop table and remove run files."""
+        self._table = FeatureTable()
+        if self._run_dir is not None:
+            self._run_dir.cleanup()
+            self._run_dir = None
+        self._runs = []
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 # standard library imports
+import shutil
 import sys
 from pathlib import Path
 
@@ -11,9 +12,13 @@ from loguru import logger
 
 # module imports
 from . import cli
+from .bgzf import is_bgzf
+from .bgzf import open_output
 from .common import COMPRESSED_TYPES
+from .common import FASTA_BLOCK_SIZE
 from .common import FASTA_TYPES
 from .common import GFF_TYPES
+from .faidx import write_indexes
 
 
 @cli.command()
@@ -26,31 +31,43 @@ from .common import GFF_TYPES
 def index_fasta(fasta, compress):
     """Index and optionally compress a fasta file.
 
+    Already bgzip-compressed files are indexed as-is.  The .fai (and
+    .gzi) indexes are the same as samtools faidx writes.
 
         \b
     Examples:
         bionorm index_fasta Medicago_truncatula/jemalong_A17.gnm5.ann1.FAKE/medtr.jemalong_A17.gnm5.FAKE.genome_main.fna
     """
-    from sh import bgzip  # isort:skip
-    from sh import samtools  # isort:skip
-
     target = Path(fasta)
     if len(target.suffixes) < 1:
         error_message = f"Target {target} does not have a file extension."
         logger.error(error_message)
         sys.exit(1)
-    if target.suffix.lstrip(".") in COMPRESSED_TYPES:
-        logger.error(f"Uncompress {target} befor indexing.")
-        sys.exit(1)
-    if target.suffix.lstrip(".") not in FASTA_TYPES:
+    extension = target.suffix.lstrip(".")
+    compressed = extension in COMPRESSED_TYPES
+    if compressed:
+        if not is_bgzf(target):
+            logger.error(f"Recompress {target} with bgzip before indexing.")
+            sys.exit(1)
+        extension = Path(target.stem).suffix.lstrip(".")
+    if extension not in FASTA_TYPES:
         logger.error(
             f"File {target} does not have a recognized FASTA extension."
         )
         sys.exit(1)
-    if compress:
-        output = bgzip(["-f", "--index", str(target)])
-        target = Path(target.parent) / f"{target.name}.gz"
-    output = samtools(["faidx", str(target)])
+    if compress and not compressed:
+        compressed_target = Path(target.parent) / f"{target.name}.gz"
+        with target.open("rb") as in_fh, open_output(
+            compressed_target, compress=True
+        ) as out_fh:
+            shutil.copyfileobj(in_fh, out_fh, FASTA_BLOCK_SIZE)
+        target.unlink()  # replaced, as by bgzip
+        target = compressed_target
+    try:
+        write_indexes(target)
+    except ValueError as error:
+        logger.error(f"Cannot index {target}: {error}")
+        sys.exit(1)
     return target
 
 
@@ -64,6 +81,8 @@ def index_fasta(fasta, compress):
 def index_gff(gff, compress):
     """Index and optionally compress a GFF file.
 
+    Already bgzip-compressed files are indexed as-is.
+
         \b
     Examples:
         bionorm index_gff Medicago_truncatula/jemalong_A17.gnm5.ann1.FAKE/medtr.jemalong_A17.gnm5.ann1.FAKE.gene_models_main.gff3
@@ -76,15 +95,19 @@ def index_gff(gff, compress):
         error_message = f"Target {target} does not have a file extension."
         logger.error(error_message)
         sys.exit(1)
-    if target.suffix.lstrip(".") in COMPRESSED_TYPES:
-        logger.error(f"Uncompress {target} befor indexing.")
-        sys.exit(1)
-    if target.suffix.lstrip(".") not in GFF_TYPES:
+    extension = target.suffix.lstrip(".")
+    compressed = extension in COMPRESSED_TYPES
+    if compressed:
+        if not is_bgzf(target):
+            logger.error(f"Recompress {target} with bgzip before indexing.")
+            sys.exit(1)
+        extension = Path(target.stem).suffix.lstrip(".")
+    if extension not in GFF_TYPES:
         logger.error(
             f"File {target} does not have a recognized GFF extension."
         )
         sys.exit(1)
-    if compress:
+    if compress and not compressed:
         output = bgzip(["-f", str(target)])
         target = Path(target.parent) / f"{target.name}.gz"
     output = tabix(["-p", "gff", str(target)])
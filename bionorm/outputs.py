@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Write outputs atomically and skip work whose inputs are unchanged.
+
+Outputs are written under a temporary name and renamed into place once
+complete, so a crash never leaves a truncated file under the final name.
+Each output gets a JSON sidecar recording size, mtime, and MD5 checksum
+of the inputs it was made from, and the bionorm version that made it.
+Checksums of inputs whose size and mtime match the previous sidecar are
+reused rather than computed again.  Temporary files and sidecars start
+with "_", which consistency checks and file listings skip.
+"""
+# standard library imports
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# module imports
+from .__version__ import __version__
+
+# global constants
+HIDDEN_PREFIX = "_"  # file listings skip files starting with this
+PARTIAL_SUFFIX = ".partial"
+SIDECAR_SUFFIX = ".source.json"
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def partial_path(path):
+    """Return temporary path to write before renaming to path."""
+    path = Path(path)
+    return path.parent / f"{HIDDEN_PREFIX}{path.name}{PARTIAL_SUFFIX}"
+
+
+def sidecar_path(path):
+    """Return path of the sidecar describing inputs of path."""
+    path = Path(path)
+    return path.parent / f"{HIDDEN_PREFIX}{path.name}{SIDECAR_SUFFIX}"
+
+
+def file_checksum(path):
+    """Return MD5 hex digest of path."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(CHECKSUM_BLOCK_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def file_signature(path, previous=None):
+    """Return dictionary of path, size, mtime, and checksum.
+
+    The checksum of previous, an earlier signature of path, is reused if
+    size and mtime still match, so that path is not read again.
+    """
+    stat = os.stat(path)
+    signature = {
+        "path": str(Path(path).resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if previous is not None and all(
+        previous.get(key) == value for key, value in signature.items()
+    ):
+        signature["md5"] = previous["md5"]
+    else:
+        signature["md5"] = file_checksum(path)
+    return signature
+
+
+def is_unchanged(path, signature):
+    """Return True if path matches signature, checksumming only if needed."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != signature["size"]:
+        return False
+    if stat.st_mtime_ns == signature["mtime_ns"]:
+        return True
+    return file_checksum(path) == signature["md5"]
+
+
+def read_sidecar(path):
+    """Return sidecar dictionary for path, None if missing or unreadable."""
+    try:
+        with sidecar_path(path).open("rt") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class AtomicOutputs:
+
+    """Outputs of one command, written atomically with sidecars.
+
+    Write each output to path(output).  commit() renames the outputs
+    into place and writes their sidecars; leaving the context without
+    commit() deletes the temporary files.  Optional outputs are those a
+    command may or may not produce for a given input.
+    """
+
+    def __init__(self, outputs, inputs, options, optional=()):
+        """Set output and input paths and options that affect outputs."""
+        self.outputs = [Path(p) for p in outputs]
+        self.optional = [Path(p) for p in optional]
+        self.inputs = [Path(p) for p in inputs]
+        self.options = dict(options)
+        self._signatures = None
+
+    def path(self, output):
+        """Return temporary path to write output to."""
+        return partial_path(output)
+
+    def up_to_date(self):
+        """Return True if outputs exist and were made from current inputs."""
+        records = []
+        for output in self.outputs:
+            record = read_sidecar(output)
+            if (
+                record is None
+                or not output.is_file()
+                or output.stat().st_size != record["size"]
+            ):
+                return False
+            records.append(record)
+        first = records[0]
+        for record in records[1:]:
+            if record["inputs"] != first["inputs"]:
+                return False
+        if first.get("version") != __version__:  # output format may differ
+            return False
+        if first["options"] != self.options:
+            return False
+        input_paths = [str(p.resolve()) for p in self.inputs]
+        if input_paths != [s["path"] for s in first["inputs"]]:
+            return False
+        outdir = self.outputs[0].parent
+        for name in first["outputs"]:
+            if not (outdir / name).is_file():
+                return False
+        return all(
+            is_unchanged(path, signature)
+            for path, signature in zip(self.inputs, first["inputs"])
+        )
+
+    def input_signatures(self):
+        """Return signatures of inputs, reusing checksums of the sidecar."""
+        record = read_sidecar(self.outputs[0]) or {}
+        previous = {s["path"]: s for s in record.get("inputs", [])}
+        return [
+            file_signature(p, previous.get(str(p.resolve())))
+            for p in self.inputs
+        ]
+
+    def __enter__(self):
+        """Record input signatures before outputs are written."""
+        self._signatures = self.input_signatures()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Delete temporary files left uncommitted."""
+        self.discard()
+
+    def discard(self):
+        """Delete temporary files."""
+        for output in self.outputs + self.optional:
+            temp_path = self.path(output)
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def commit(self):
+        """Rename outputs into place and write their sidecars."""
+        if self._signatures is None:
+            self._signatures = self.input_signatures()
+        written = list(self.outputs)
+        for output in self.optional:
+            if self.path(output).exists():
+                written.append(output)
+            else:  # not produced this time, remove any stale copy
+                for stale in (output, sidecar_path(output)):
+                    if stale.exists():
+                        stale.unlink()
+        for output in written:  # no sidecar may vouch for a new output
+            if sidecar_path(output).exists():
+                sidecar_path(output).unlink()
+        for output in written:
+            os.replace(self.path(output), output)
+        for output in written:
+            record = {
+                "version": __version__,
+                "options": self.options,
+                "inputs": self._signatures,
+                "outputs": [p.name for p in written],
+                "size": output.stat().st_size,
+            }
+            temp_path = self.path(sidecar_path(output))
+            with temp_path.open("wt") as fh:
+                json.dump(record, fh, indent=2)
+            os.replace(temp_path, sidecar_path(output))
@@ -2,23 +2,42 @@
 """Define prefixing commands."""
 
 # standard library imports
-import os
+import contextlib
+import csv
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 # first-party imports
 import click
 from loguru import logger
+from ruamel.yaml import YAML
 
 # module imports
 from . import cli
 from . import click_loguru
+from .bgzf import open_input
+from .bgzf import open_output
+from .common import FASTA_BLOCK_SIZE
 from .common import GENUS_CODE_LEN
 from .common import SPECIES_CODE_LEN
+from .common import next_fasta_header
+from .gff import MEGABYTE
+from .gff import FeatureSorter
+from .gff import TypeHierarchy
+from .gff import parse_ids
+from .gff import rewrite_feature
+from .outputs import AtomicOutputs
 
 # global constants
 GFF_SPLIT_MAGIC = ["##gff-version", "3"]
+FASTA_HEADER_RE = re.compile(rb"^>(\S+)\s*(.*)")  # match header
+FASTA_EXTENSIONS = ("fna", "faa", "fa", "fasta", "frn")
+GFF_EXTENSIONS = ("gff", "gff3")
+MANIFEST_COLUMNS = ("file", "genus", "species", "infra_id", "genver", "key")
 
 
 def organism_code(genus, species):
@@ -45,6 +64,77 @@ def get_genome_dir(infra_id, genver=None, annver=None, key=None):
     return dirname
 
 
+def _rewrite_header(line, prefix):
+    """Return header line with prefix added to ID, or None if not a header."""
+    parsed_header = FASTA_HEADER_RE.match(line.rstrip())
+    if parsed_header is None:
+        return None
+    hid, desc = parsed_header.groups()
+    return b">" + prefix + hid + b" " + desc
+
+
+def rewrite_fasta_headers(
+    in_fh, out_fh, name_prefix, block_size=FASTA_BLOCK_SIZE
+):
+    """Copy FASTA from in_fh to out_fh, prefixing the ID of every header.
+
+    Both handles are binary.  Input is read in large blocks, sequence bytes
+    are copied through with CRLF line ends made LF, and only lines starting
+    with ">" are parsed and rewritten.  Returns the number of headers
+    rewritten.
+    """
+    prefix = f"{name_prefix}.".encode()
+    n_headers = 0
+    at_line_start = True  # previous block ended with a newline
+    pending = b""  # header line split across blocks
+    while True:
+        block = in_fh.read(block_size)
+        if not block:
+            break
+        if block.endswith(b"\r"):  # keep CRLF within one block
+            block += in_fh.read(1)
+        if b"\r\n" in block:  # lines end in LF, as when read as text
+            block = block.replace(b"\r\n", b"\n")
+        if pending:
+            block = pending + block
+            pending = b""
+        view = memoryview(block)
+        pos = 0  # start of bytes not yet written
+        if at_line_start and block.startswith(b">"):
+            header_pos = 0
+        else:
+            header_pos = next_fasta_header(block, 0)
+        while header_pos != -1:
+            end_pos = block.find(b"\n", header_pos)
+            if end_pos == -1:  # header continues in next block
+                pending = block[header_pos:]
+                break
+            new_header = _rewrite_header(block[header_pos:end_pos], prefix)
+            if new_header is not None:
+                out_fh.write(view[pos:header_pos])
+                out_fh.write(new_header)
+                pos = end_pos  # newline goes out with the next segment
+                n_headers += 1
+            header_pos = next_fasta_header(block, end_pos)
+        if pending:
+            out_fh.write(view[pos : len(block) - len(pending)])
+            at_line_start = True
+        else:
+            out_fh.write(view[pos:])
+            at_line_start = block.endswith(b"\n")
+    if pending:  # last line is a header without newline
+        new_header = _rewrite_header(pending, prefix)
+        if new_header is None:
+            out_fh.write(pending)
+        else:
+            out_fh.write(new_header)
+            n_headers += 1
+        at_line_start = False
+    if not at_line_start:
+        out_fh.write(b"\n")
+    return n_headers
+
+
 @cli.command()
 @click_loguru.init_logger()
 @click.option(
@@ -63,18 +153,65 @@ def get_genome_dir(infra_id, genver=None, annver=None, key=None):
     metavar="<STRING, len=4>",
     help="4-character unique identifier.",
 )
+@click.option(
+    "--compress",
+    is_flag=True,
+    default=False,
+    help="Write bgzip-compressed output.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Rewrite outputs even if up to date with inputs.",
+)
 @click.argument(
     "fastafile", type=click.Path(exists=True, readable=True, dir_okay=False)
 )
-def prefix_fasta(fastafile, genver, genus, species, infra_id, key):
+def prefix_fasta(
+    fastafile, genver, genus, species, infra_id, key, compress, force
+):
     """Prefix FASTA files to data store standards.
 
+    Input may be plain text, gzip, or bgzip compressed.  Output is written
+    to a temporary file and renamed when complete; an output up to date
+    with its input is kept unless --force is given.
+
     \b
     Example:
         bionorm prefix-fasta --genver 5 --genus medicago --species truncatula \\
                 --infra_id jemalong_A17 --key FAKE example_jemalong.fna
     """
-    re_header = re.compile(r"^>(\S+)\s*(.*)")  # match header
+    fasta_file_path = prefix_fasta_file(
+        fastafile,
+        genver,
+        genus,
+        species,
+        infra_id,
+        key,
+        compress=compress,
+        force=force,
+    )
+    if fasta_file_path is None:
+        sys.exit(1)
+    logger.info(fasta_file_path)
+    return fasta_file_path
+
+
+def prefix_fasta_file(
+    fastafile,
+    genver,
+    genus,
+    species,
+    infra_id,
+    key,
+    compress=False,
+    force=False,
+):
+    """Prefix a FASTA file, returning output path or None on error.
+
+    Output is skipped if up to date with its input unless force is set.
+    """
     org_code = organism_code(genus, species)
     new_file_dir = (
         Path(".")
@@ -86,95 +223,37 @@ def prefix_fasta(fastafile, genver, genus, species, infra_id, key):
         new_file_dir
         / f"{org_code}.{infra_id}.gnm{genver}.{key}.genome_main.fna"
     )
-    new_fasta = open(fasta_file_path, "w")
+    if compress:
+        fasta_file_path = new_file_dir / f"{fasta_file_path.name}.gz"
     name_prefix = f"{org_code}.{infra_id}.gnm{genver}"
-    n_headers = 0
-    with Path(fastafile).open("r") as gopen:
-        for line in gopen:
-            line = line.rstrip()
-            if re_header.match(line):  # header line
-                parsed_header = re_header.search(line).groups()
-                logger.debug(line)
-                logger.debug(parsed_header)
-                if isinstance(parsed_header, str):  # check tuple
-                    hid = parsed_header
-                    new_header = f">{name_prefix}.{hid}"
-                    n_headers += 1
-                    logger.debug(hid)
-                else:
-                    if len(parsed_header) == 2:  # header and description
-                        hid = parsed_header[0]  # header
-                        desc = parsed_header[1]  # description
-                        new_header = f">{name_prefix}.{hid} {desc}"
-                        n_headers += 1
-                        logger.debug(hid)
-                        logger.debug(desc)
-                        logger.debug(new_header)
-                    else:
-                        logger.error(f"header {line} looks odd...")
-                        sys.exit(1)
-                new_fasta.write(new_header + "\n")  # write new header
-            else:  # sequence lines
-                new_fasta.write(line + "\n")
-    new_fasta.close()
-    if not n_headers:
-        logger.error(
-            f"file {fastafile} contains no headers, are you sure it is a"
-            " FASTA?"
-        )
-        os.remove(fasta_file_path)
-        sys.exit(1)
+    outputs = AtomicOutputs(
+        [fasta_file_path],
+        [fastafile],
+        {"command": "prefix-fasta", "name_prefix": name_prefix},
+    )
+    if not force and outputs.up_to_date():
+        logger.info(f"{fasta_file_path} is up to date with {fastafile}")
+        return fasta_file_path
+    with outputs:
+        with open_input(fastafile) as gopen:
+            with open_output(outputs.path(fasta_file_path), compress) as out:
+                n_headers = rewrite_fasta_headers(gopen, out, name_prefix)
+        if not n_headers:
+            logger.error(
+                f"file {fastafile} contains no headers, are you sure it is a"
+                " FASTA?"
+            )
+            return None
+        outputs.commit()
     if not fasta_file_path.is_file():
         logger.error(
             f"Output file {fasta_file_path} not found for normalize fasta"
         )
-        sys.exit(1)  # new file not found return False
+        return None  # new file not found
     logger.debug(f"{n_headers} sequences in output file")
-    logger.info(fasta_file_path)
     return fasta_file_path
 
 
-def type_rank(hierarchy, feature_type):
-    """Return rank or code 1000 if feature_type not found."""
-    if feature_type in hierarchy:
-        return hierarchy[feature_type]["rank"]
-    else:
-        return 1000  # no feature id, no children, no order
-
-
-def update_hierarchy(hierarchy, feature_type, parent_types):
-    """Break input gff3 line into attributes.
-
-    Determines feature type hierarchy using type and attributes fields.
-    """
-    if not parent_types:  # this feature must be a root
-        if feature_type not in hierarchy:  # add to hierarchy
-            hierarchy[feature_type] = {
-                "children": [],
-                "parents": [],
-                "rank": 0,
-            }
-        hierarchy[feature_type]["rank"] = 1  # rank is 1 because no parents
-    else:  # feature has parents
-        if feature_type not in hierarchy:
-            hierarchy[feature_type] = {
-                "children": [],
-                "parents": [],
-                "rank": 0,
-            }
-        hierarchy[feature_type]["parents"] = parent_types
-        for p in parent_types:  # set children and aprents for all p
-            if hierarchy.get(p):
-                if feature_type not in hierarchy[p]["children"]:
-                    hierarchy[p]["children"].append(feature_type)
-            else:
-                hierarchy[p] = {
-                    "children": [feature_type],
-                    "parents": [],
-                    "rank": 0,
-                }
-
-
 @cli.command()
 @click_loguru.init_logger()
 @click.option("--genver", required=True, type=int, help="Genome version number.")
@@ -197,17 +276,100 @@ def update_hierarchy(hierarchy, feature_type, parent_types):
 @click.option(
     "--sort_only", is_flag=True, help="Perform sorting only.", default=False
 )
+@click.option(
+    "--compress",
+    is_flag=True,
+    default=False,
+    help="Write bgzip-compressed output.",
+)
+@click.option(
+    "--max_memory",
+    type=int,
+    default=None,
+    metavar="<MB>",
+    help="Sort on disk, holding at most this many MB of features in memory.",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Processes for sorting and prefixing seqids held in memory.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Rewrite outputs even if up to date with inputs.",
+)
 @click.argument(
     "gff3file", type=click.Path(exists=True, readable=True, dir_okay=False)
 )
-def prefix_gff(gff3file, genver, annver, genus, species, infra_id, key, sort_only):
+def prefix_gff(
+    gff3file,
+    genver,
+    annver,
+    genus,
+    species,
+    infra_id,
+    key,
+    sort_only,
+    compress,
+    max_memory,
+    jobs,
+    force,
+):
     """Prefix and sort GFF3 file to data store standards.
 
+    Input may be plain text, gzip, or bgzip compressed.  With --max_memory,
+    sorted runs are spilled to temporary files in the output directory and
+    merged, giving the same output as the in-memory sort.  With --jobs,
+    features on each seqid are sorted and prefixed in parallel.  An output
+    up to date with its input is kept unless --force is given.
+
     \b
     Example:
         bionorm prefix-gff --genver 5 --annver 1 --species truncatula --genus medicago \\
                 --infra_id jemalong_A17 --key FAKE example_jemalong.gff3
     """
+    gff_file_path = prefix_gff_file(
+        gff3file,
+        genver,
+        annver,
+        genus,
+        species,
+        infra_id,
+        key,
+        sort_only=sort_only,
+        compress=compress,
+        max_memory=max_memory,
+        jobs=jobs,
+        force=force,
+    )
+    if gff_file_path is None:
+        sys.exit(1)
+    logger.info(gff_file_path)
+    return gff_file_path
+
+
+def prefix_gff_file(
+    gff3file,
+    genver,
+    annver,
+    genus,
+    species,
+    infra_id,
+    key,
+    sort_only=False,
+    compress=False,
+    max_memory=None,
+    jobs=1,
+    force=False,
+):
+    """Prefix and sort a GFF3 file, returning output path or None on error.
+
+    Output is skipped if up to date with its input unless force is set.
+    """
     gnm = f"gnm{genver}"
     ann = f"ann{annver}"
     if sort_only:
@@ -224,117 +386,288 @@ def prefix_gff(gff3file, genver, annver, genus, species, infra_id, key, sort_onl
         exist_ok=True, parents=True
     )  # make genus species dir for output
     gff_file_path = new_file_dir / new_gff_name
-    new_gff = open(gff_file_path, "w")
-    get_id = re.compile("ID=([^;]+)")  # gff3 get id string
-    get_name = re.compile("Name=([^;]+)")  # get name string
-    get_parents = re.compile("Parent=([^;]+)")  # get parents
-    gff3_lines = []  # will be sorted after loading and hierarchy
-    sub_tree = {}  # feature hierarchy sub tree
-    type_hierarchy = {}  # type hierarchy for features, will be ranked
-    prefix_name = False
-    n_lines = 0
-    with Path(gff3file).open("r") as gopen:
-        for line in gopen:
-            line = line.rstrip()
-            if not line:
-                continue
-            n_lines += 1
-            if n_lines == 1:  # magic in first line
-                if not line.split() == GFF_SPLIT_MAGIC:
-                    logger.error(
-                        "File does not start with GFF3 magic, are you sure is"
-                        " is a GFF3?"
-                    )
-                    new_gff.close()
-                    os.remove(gff_file_path)
-                    sys.exit(1)
-            if line.startswith("#"):  # header
-                if sort_only:  # do not prefix
-                    new_gff.write(f"{line}\n")
+    if compress:
+        gff_file_path = new_file_dir / f"{new_gff_name}.gz"
+    seqid_prefix = f"{org_code}.{infra_id}.{gnm}."
+    feature_prefix = f"{org_code}.{infra_id}.{gnm}.{ann}"
+    outputs = AtomicOutputs(
+        [gff_file_path],
+        [gff3file],
+        {
+            "command": "prefix-gff",
+            "sort_only": sort_only,
+            "feature_prefix": feature_prefix,
+        },
+    )
+    if not force and outputs.up_to_date():
+        logger.info(f"{gff_file_path} is up to date with {gff3file}")
+        return gff_file_path
+    with outputs, contextlib.ExitStack() as stack:  # closed on errors too
+        new_gff = stack.enter_context(
+            open_output(outputs.path(gff_file_path), compress, "wt")
+        )
+        type_hierarchy = TypeHierarchy()  # ranked once all features are read
+        sorter = stack.enter_context(
+            FeatureSorter(
+                max_memory, tmpdir=new_file_dir, hierarchy=type_hierarchy
+            )
+        )
+        prefix_name = False
+        n_lines = 0
+        with open_input(gff3file, "rt") as gopen:
+            for line_no, line in enumerate(gopen, 1):
+                line = line.rstrip()
+                if not line:
                     continue
-                if line.startswith("##sequence-region"):  # replace header
-                    fields = re.split(r"\s+", line)
-                    ref_name = f"{org_code}.{infra_id}.{gnm}.{fields[1]}"
-                    line = re.sub(fields[1], ref_name, line)
-                new_gff.write(f"{line}\n")
-                continue
-            fields = line.split("\t")
-            gff3_lines.append(fields)
-            feature_id = get_id.search(fields[-1])
-            parent_ids = get_parents.search(fields[-1])
-            if parent_ids:
-                parent_ids = parent_ids.group(1).split(",")
-            else:
-                parent_ids = []
-            if not feature_id:
-                continue
-            feature_id = feature_id.group(1)
-            sub_tree[feature_id] = {
-                "type": fields[2],
-                "parent_ids": parent_ids,
-            }  # parent child
-    for f in sub_tree:
-        feature_type = sub_tree[f]["type"]
-        parent_types = []
-        for p in sub_tree[f]["parent_ids"]:
-            parent_type = sub_tree[p]["type"]
-            if not parent_type:  # must have type
-                logger.error(f"could not find type for parent {parent_type}")
-                sys.exit(1)  # error no type
-            parent_types.append(parent_type)
-        update_hierarchy(type_hierarchy, feature_type, parent_types)
-    ranking = 1  # switch to stop ranking in while below
-    while ranking:  # this is over-engineered for tabix indexing, but tis cool
-        check = 0  # switch to indicate no features unranked
-        for t in sorted(
-            type_hierarchy,
-            key=lambda k: type_hierarchy[k]["rank"],
-            reverse=True,
-        ):
-            if type_hierarchy[t]["rank"]:  # rank !=0
-                for c in type_hierarchy[t]["children"]:
-                    if not type_hierarchy[c]["rank"]:
-                        type_hierarchy[c]["rank"] = (
-                            type_hierarchy[t]["rank"] + 1
+                n_lines += 1
+                if n_lines == 1:  # magic in first line
+                    if not line.split() == GFF_SPLIT_MAGIC:
+                        logger.error(
+                            "File does not start with GFF3 magic, are you"
+                            " sure is is a GFF3?"
                         )
-            else:  # rank == 0
-                check = 1
-        if not check:  # escape loop when all features are ranked
-            ranking = 0
-    feature_prefix = f"{org_code}.{infra_id}.{gnm}.{ann}"
-    for l in sorted(
-        gff3_lines,
-        key=lambda x: (x[0], int(x[3]), type_rank(type_hierarchy, x[2])),
-    ):  # rank by chromosome, start, type_rank and stop
+                        return None
+                if line.startswith("#"):  # header
+                    if sort_only:  # do not prefix
+                        new_gff.write(f"{line}\n")
+                        continue
+                    if line.startswith("##sequence-region"):  # replace
+                        fields = re.split(r"\s+", line)
+                        ref_name = f"{seqid_prefix}{fields[1]}"
+                        line = re.sub(fields[1], ref_name, line)
+                    new_gff.write(f"{line}\n")
+                    continue
+                fields = line.split("\t")
+                sorter.add(line, fields)
+                feature_id, parent_ids = parse_ids(fields[-1])
+                if feature_id is not None:
+                    type_hierarchy.add_feature(
+                        feature_id, fields[2], parent_ids, line_no
+                    )
+        type_hierarchy.rank()  # parent types sort before child types
+        if type_hierarchy.missing_parents:
+            logger.warning(
+                f"{len(type_hierarchy.missing_parents)} features have parent"
+                f" IDs not found in {gff3file}, first at line"
+                f" {type_hierarchy.missing_parents[0]}"
+            )
+        if type_hierarchy.cyclic_types:
+            logger.warning(
+                "types in or below a cycle of parents will sort last:"
+                f" {', '.join(type_hierarchy.cyclic_types)}"
+            )
         if sort_only:  # do not prefix or change IDs
-            l = "\t".join(l)
-            new_gff.write(f"{l}\n")
-            continue
-        l[0] = f"{org_code}.{infra_id}.{gnm}.{l[0]}"  # rename
-        l = "\t".join(l)
-        feature_id = get_id.search(l)
-        feature_name = get_name.search(l)
-        feature_parents = get_parents.search(l)
-        if feature_id:  # if id set new id
-            new_id = f"{feature_prefix}.{feature_id.group(1)}"
-            l = get_id.sub(f"ID={new_id}", l)
-        if feature_name and prefix_name:  # if name and flag set new name
-            new_name = f"{feature_prefix}.{feature_name.group(1)}"
-            l = get_name.sub(f"Name={new_name}", l)
-        if feature_parents:  # parents set new parent ids
-            parent_ids = feature_parents.group(1).split(",")
-            new_ids = []
-            for p in parent_ids:  # for all parents
-                new_id = f"{feature_prefix}.{p}"
-                new_ids.append(new_id)
-            new_ids = ",".join(new_ids)  # set delimiter for multiple parents
-            l = get_parents.sub(f"Parent={new_ids}", l)
-        new_gff.write(f"{l}\n")
-    new_gff.close()
+            rewrite = rewrite_feature
+        else:
+            rewrite = partial(
+                rewrite_feature,
+                seqid_prefix=seqid_prefix,
+                feature_prefix=feature_prefix,
+                prefix_name=prefix_name,
+            )
+        for text in sorter.sorted_lines(
+            type_hierarchy.type_rank, rewrite, jobs=jobs
+        ):  # rank by chromosome, start, type_rank and stop
+            new_gff.write(text)
+        stack.close()  # output complete before it is renamed
+        outputs.commit()
     if not gff_file_path.is_file():  # check for output error if not found
         logger.error(
             f"Output file {gff_file_path} not found for normalize gff"
         )
-        sys.exit(1)  # new file not found return False
-    logger.info(gff_file_path)
+        return None  # new file not found
     return gff_file_path  # return path to new gff file
+
+
+def read_manifest(manifest):
+    """Return list of row dictionaries from a TSV or YAML manifest.
+
+    Relative file paths are taken relative to the manifest directory.
+    """
+    manifest = Path(manifest)
+    if manifest.suffix in (".yaml", ".yml"):
+        with manifest.open("rt") as fh:
+            rows = YAML(typ="safe").load(fh) or []
+    else:
+        with manifest.open("rt", newline="") as fh:
+            rows = list(
+                csv.DictReader(
+                    (line for line in fh if not line.startswith("#")),
+                    delimiter="\t",
+                )
+            )
+    jobs = []
+    for row_no, row in enumerate(rows, 1):
+        row = {k: v for k, v in row.items() if v not in (None, "")}
+        missing = [c for c in MANIFEST_COLUMNS if c not in row]
+        if missing:
+            logger.error(
+                f"row {row_no} of {manifest} lacks {', '.join(missing)}"
+            )
+            return None
+        path = manifest.parent / str(row["file"])
+        if not path.is_file():
+            logger.error(f"row {row_no} of {manifest}: {path} not found")
+            return None
+        file_type = manifest_file_type(path)
+        if file_type is None:
+            logger.error(
+                f"row {row_no} of {manifest}: cannot tell whether {path}"
+                " is FASTA or GFF3 from its extension"
+            )
+            return None
+        if file_type == "gff3" and "annver" not in row:
+            logger.error(f"row {row_no} of {manifest}: GFF3 needs annver")
+            return None
+        jobs.append(
+            {
+                "file": path,
+                "type": file_type,
+                "genus": str(row["genus"]),
+                "species": str(row["species"]),
+                "infra_id": str(row["infra_id"]),
+                "genver": int(row["genver"]),
+                "annver": int(row["annver"]) if "annver" in row else None,
+                "key": str(row["key"]),
+            }
+        )
+    return jobs
+
+
+def manifest_file_type(path):
+    """Return "fasta" or "gff3" from file extension, None if unknown."""
+    name = path.name[:-3] if path.name.endswith(".gz") else path.name
+    extension = name.rsplit(".", 1)[-1].lower()
+    if extension in FASTA_EXTENSIONS:
+        return "fasta"
+    if extension in GFF_EXTENSIONS:
+        return "gff3"
+    return None
+
+
+def run_batch_job(
+    job, compress=False, sort_only=False, max_memory=None, force=False
+):
+    """Prefix one manifest row, returning (output path, seconds).
+
+    The output path is None if prefixing failed, so that one bad file
+    does not stop the batch.
+    """
+    start_time = time.perf_counter()
+    try:
+        if job["type"] == "fasta":
+            out_path = prefix_fasta_file(
+                job["file"],
+                job["genver"],
+                job["genus"],
+                job["species"],
+                job["infra_id"],
+                job["key"],
+                compress=compress,
+                force=force,
+            )
+        else:
+            out_path = prefix_gff_file(
+                job["file"],
+                job["genver"],
+                job["annver"],
+                job["genus"],
+                job["species"],
+                job["infra_id"],
+                job["key"],
+                sort_only=sort_only,
+                compress=compress,
+                max_memory=max_memory,
+                force=force,
+            )
+    except Exception as error:  # report and go on with the batch
+        logger.error(f"{job['file']}: {type(error).__name__}: {error}")
+        out_path = None
+    return out_path, time.perf_counter() - start_time
+
+
+@cli.command()
+@click_loguru.init_logger()
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Files prefixed at once, in separate processes.",
+)
+@click.option(
+    "--compress",
+    is_flag=True,
+    default=False,
+    help="Write bgzip-compressed output.",
+)
+@click.option(
+    "--sort_only",
+    is_flag=True,
+    default=False,
+    help="Sort GFF3 files only.",
+)
+@click.option(
+    "--max_memory",
+    type=int,
+    default=None,
+    metavar="<MB>",
+    help="Sort GFF3 on disk, holding at most this many MB per file.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Rewrite outputs even if up to date with inputs.",
+)
+@click.argument(
+    "manifest", type=click.Path(exists=True, readable=True, dir_okay=False)
+)
+def prefix_batch(manifest, jobs, compress, sort_only, max_memory, force):
+    """Prefix FASTA and GFF3 files listed in a manifest.
+
+    The manifest is a tab-separated file with a header line, or a YAML list
+    of mappings, with fields file, genus, species, infra_id, genver, annver
+    (GFF3 only), and key.  FASTA or GFF3 is told from the file extension.
+    Files are processed largest first and throughput is reported per file.
+
+    \b
+    Example:
+        bionorm prefix-batch --jobs 4 release.tsv
+    """
+    batch = read_manifest(manifest)
+    if batch is None:
+        sys.exit(1)
+    batch.sort(key=lambda job: job["file"].stat().st_size, reverse=True)
+    logger.info(f"prefixing {len(batch)} files from {manifest}")
+    run_job = partial(
+        run_batch_job,
+        compress=compress,
+        sort_only=sort_only,
+        max_memory=max_memory,
+        force=force,
+    )
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_job, batch))
+    else:
+        results = [run_job(job) for job in batch]
+    n_failed = 0
+    total_size = 0
+    for job, (out_path, elapsed) in zip(batch, results):
+        if out_path is None:
+            logger.error(f"{job['file']} FAILED")
+            n_failed += 1
+            continue
+        size = job["file"].stat().st_size / MEGABYTE
+        total_size += size
+        logger.info(
+            f"{out_path}: {size:.1f} MB in {elapsed:.2f} s,"
+            f" {size / max(elapsed, 1e-6):.1f} MB/s"
+        )
+    logger.info(
+        f"{len(batch) - n_failed} of {len(batch)} files,"
+        f" {total_size:.1f} MB prefixed"
+    )
+    if n_failed:
+        sys.exit(1)
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 # standard library imports
-import gzip
 import hashlib
 import os
 import re
@@ -12,23 +11,23 @@ import sys
 # first-party imports
 from loguru import logger
 
+# module imports
+from .bgzf import open_input
+from .faidx import HeaderSource
+from .gff import FeatureOrderChecker
+from .gff import GffScan
+from .stats import GffStats
+
+# global defs
+GET_ID = re.compile("ID=([^;]+)")
+
 
 def return_filehandle(open_me):
-    """return file handle for gz compressed or text file"""
-    magic_dict = {  # headers for compression
-        b"\x1f\x8b\x08": "gz",
-        #                 '\x42\x5a\x68': 'bz2',
-        #                 '\x50\x4b\x03\x04': 'zip'
-    }
-    max_bytes = max(len(t) for t in magic_dict)
-    with open(open_me, "rb") as f:
-        s = f.read(max_bytes)
-    for m in magic_dict:
-        if s.startswith(m):  # check file header for match with m
-            t = magic_dict[m]
-            if t == "gz":
-                return gzip.open(open_me, "rt")
-    return open(open_me)
+    """return text file handle for bgzip, gzip or plain text file
+
+    bgzip files are inflated on all cores
+    """
+    return open_input(open_me, "rt")
 
 
 class genome_main:
@@ -95,37 +94,21 @@ class genome_main:
         fasta = self.target  # get fasta file
         attr = os.path.basename(fasta).split(".")  # get attributes for naming
         true_header = ".".join(attr[:3])
-        fh = return_filehandle(fasta)  # get file handle, text/gz
-        # grab header and description
-        re_header = re.compile(r"^>(\S+)\s*(.*)")
+        headers = HeaderSource(fasta)  # names from .fai if current
+        logger.debug(f"Reading sequence names from {headers}")
         passed = True
-        with fh as gopen:
-            for line in gopen:
-                line = line.rstrip()
-                if not line:
-                    continue
-                if re_header.match(line):  # check for fasta header
-                    hid = re_header.search(line)
-                    if hid:
-                        logger.debug(hid.groups(0))
-                        if isinstance(hid, str):  # check for tuple
-                            hid = hid.groups(0)
-                        else:
-                            hid = hid.groups(0)[0]  # get id portion of header
-                    else:
-                        logger.error(f"Header {line} looks odd...")
-                        return False
-                    logger.debug(hid)
-                    self.detector.fasta_ids[hid] = 1
-                    standard_header = true_header + "." + hid
-                    if not hid.startswith(true_header):
-                        logger.warning(
-                            (
-                                f"Inconsistency {hid} "
-                                + f"Should be {standard_header}"
-                            )
-                        )
-                        passed = False
+        for hid in headers:
+            if not hid:
+                logger.error(f"Header without name in {fasta} looks odd...")
+                return False
+            logger.debug(hid)
+            self.detector.fasta_ids.add(hid)
+            standard_header = true_header + "." + hid
+            if not hid.startswith(true_header):
+                logger.warning(
+                    (f"Inconsistency {hid} " + f"Should be {standard_header}")
+                )
+                passed = False
         return passed
 
 
@@ -162,6 +145,46 @@ class phen:
         return True
 
 
+class SeqidAttributeCheck:
+
+    """GFF3 visitor checking seqids against genome_main and gene IDs."""
+
+    def __init__(self, gff, fasta_ids):
+        """Set expected gene ID prefix from gff name and genome seqids."""
+        file_name = os.path.basename(gff)
+        # ID should start with this string
+        self.true_id = ".".join(file_name.split(".")[:4])
+        self.fasta_ids = fasta_ids  # set of FASTA IDs from Reference
+        self.seen = {}
+        self.passed = True
+
+    def visit(self, fields, line_no):
+        """Check seqid of every feature and ID of genes."""
+        seqid = fields[0].rstrip()  # seqid according to the spec
+        if self.fasta_ids:  # if genome_main make sure seqids exist
+            if seqid not in self.fasta_ids:  # fasta header check
+                if seqid not in self.seen:
+                    logger.error(f"{seqid} not found in genome_main")
+                    self.seen[seqid] = 1
+                self.passed = False
+        if fields[2] != "gene":  # only check genes (for now)
+            return
+        feature_id = GET_ID.search(fields[8])  # attributes ';' delimited
+        if not feature_id:  # check for ID and Name
+            logger.error(f"No ID and Name attributes. line {line_no}")
+            self.passed = False
+        elif not feature_id.group(1).startswith(self.true_id):  # check id
+            logger.error(
+                "gene feature id, should start with "
+                + f"{self.true_id} line {line_no}"
+            )
+            self.passed = False
+
+    def finish(self):
+        """Return True if all lines passed."""
+        return self.passed
+
+
 class gene_models_main:
     def __init__(self, detector, **kwargs):
         self.detector = detector
@@ -182,10 +205,28 @@ class gene_models_main:
 #            logger.error("gt GFF3 Validation FAILED")
 #            return False
         logger.info("GFF3 is Valid\n")
+        scan = GffScan(target)  # one pass for all checks and node counts
+        seqid_check = scan.register(
+            SeqidAttributeCheck(target, self.fasta_ids)
+        )
+        order_check = None
+        if self.detector.checks.get("feature_order"):
+            order_check = scan.register(FeatureOrderChecker())
+        if self.detector.nodes:
+            node_stats = scan.register(GffStats())
         logger.info("Checking Congruency Between Genome and Gene Models...")
-        if not self.check_seqid_attributes():
+        scan.run()
+        if self.detector.nodes:
+            self.detector.feature_counts[target] = node_stats.summary
+        if not self.check_seqid_attributes(seqid_check):
             logger.error("Genome and Gene Models are not Congruent FAILED")
             return False
+        if order_check is not None:
+            logger.info("Checking Feature Order...")
+            if not self.check_feature_order(order_check):
+                logger.error("Feature Order FAILED")
+                return False
+            logger.info("Feature Order Looks Correct\n")
         logger.info("ALL GENE MODELS CHECKS PASSED")
         return True
 
@@ -255,64 +296,40 @@ class gene_models_main:
             return False
         return True
 
-    def check_seqid_attributes(self):
+    def check_seqid_attributes(self, check=None):
         """Confirms that gff3 seqid exists in genome_main if provided
 
-        checks ID and Name from gff3 attributes field
+        checks ID and Name from gff3 attributes field, check may be a
+        SeqidAttributeCheck already run by a GffScan
 
         https://github.com/LegumeFederation/datastore/issues/23
         """
-        gff = self.target
-        fasta_ids = self.fasta_ids  # list of FASTA IDS from Reference
-        logger.debug(fasta_ids)
-        fh = return_filehandle(gff)
-        file_name = os.path.basename(gff)
-        # ID should start with this string
-        true_id = ".".join(file_name.split(".")[:4])
-        true_name = file_name.split(".")[0]  # maybe this should include infra
-        #        get_id_name = re.compile("^ID=(.+?);.*Name=(.+?);")
-        get_id = re.compile("ID=([^;]+)")
-        lines = 0
-        seen = {}
-        passed = True
-        with fh as gopen:
-            for line in gopen:
-                line = line.rstrip()
-                lines += 1
-                if not line or line.startswith("#"):
-                    continue
-                columns = line.split("\t")  # get gff3 fields
-                seqid = columns[0]  # seqid according to the spec
-                seqid = seqid.rstrip()
-                logger.debug(line)
-                logger.debug(seqid)
-                if self.fasta_ids:  # if genome_main make sure seqids exist
-                    if seqid not in fasta_ids:  # fasta header check
-                        logger.debug(seqid)
-                        if seqid not in seen:
-                            logger.error(f"{seqid} not found in genome_main")
-                            seen[seqid] = 1
-                        passed = False
-                feature_type = columns[2]  # get type
-                attributes = columns[8]  # attributes ';' delimited
-                logger.debug(feature_type)
-                if feature_type != "gene":  # only check genes (for now)
-                    continue
-                #                if not get_id_name.match(attributes):  # check for ID and Name
-                if not get_id.search(attributes):  # check for ID and Name
-                    logger.error(f"No ID and Name attributes. line {lines}")
-                    passed = False
-                else:
-                    #                    groups = get_id_name.search(attributes).groups()
-                    feature_id = get_id.search(attributes).group(1)
-                    logger.debug(feature_id)
-                    if not feature_id.startswith(true_id):  # check id
-                        logger.error(
-                            "gene feature id, should start with "
-                            + f"{true_id} line {lines}"
-                        )
-                        passed = False
-        return passed
+        if check is None:
+            scan = GffScan(self.target)
+            check = scan.register(
+                SeqidAttributeCheck(self.target, self.fasta_ids)
+            )
+            scan.run()
+        return check.passed
+
+    def check_feature_order(self, checker=None):
+        """Confirms that gff3 features are sorted as by prefix-gff
+
+        seqids contiguous, then by start, then parent types before children,
+        checker may be a FeatureOrderChecker already run by a GffScan
+        """
+        if checker is None:
+            scan = GffScan(self.target)
+            checker = scan.register(FeatureOrderChecker())
+            scan.run()
+        for line_no, message in checker.errors:
+            logger.error(f"{message} line {line_no}")
+        if checker.hierarchy.cyclic_types:
+            logger.warning(
+                "types in or below a cycle of parents:"
+                f" {', '.join(checker.hierarchy.cyclic_types)}"
+            )
+        return not checker.errors
 
 
 class protein:
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""Compute DSCensor node statistics of GFF3 and FASTA files in one pass."""
+# standard library imports
+from array import array
+
+# third-party imports
+import numpy as np
+
+# module imports
+from .bgzf import is_gzipped
+from .bgzf import open_input
+from .common import FASTA_BLOCK_SIZE
+from .common import next_fasta_header
+from .faidx import fai_path
+from .faidx import index_is_current
+from .faidx import read_fai
+from .gff import FeatureCounter
+from .gff import GffScan
+from .gff import parse_ids
+
+# global constants
+LENGTH_TYPES = ("gene", "mRNA")  # feature types with length distributions
+TRANSCRIPT_EXON_TYPE = "exon"
+BASES_PER_MB = 1000000
+BASE_CLASSES = ("A", "C", "G", "T", "N", "IUPAC")
+MIN_GAP = 10  # Ns in a run that splits a scaffold into contigs
+
+
+def length_summary(lengths):
+    """Return count, min, max, mean, median, and N50 of lengths."""
+    lengths = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+    if not len(lengths):
+        return {"count": 0}
+    total = int(lengths.sum())
+    cumulative = np.cumsum(lengths)
+    n50_index = int(np.searchsorted(cumulative, total / 2))
+    return {
+        "count": len(lengths),
+        "min": int(lengths[-1]),
+        "max": int(lengths[0]),
+        "mean": round(total / len(lengths)),
+        "median": float(np.median(lengths)),
+        "N50": int(lengths[n50_index]),
+    }
+
+
+class GffStats(FeatureCounter):
+
+    """GFF3 visitor collecting type counts and distributions for nodes.
+
+    In addition to counts by type, gene and mRNA lengths, exons per
+    transcript, and feature density on each seqid are gathered.
+    """
+
+    def __init__(self):
+        """Initialize empty counts and distributions."""
+        super().__init__()
+        self.lengths = {t: array("l") for t in LENGTH_TYPES}
+        self.exons = {}  # transcript ID -> number of exons
+        self.seqids = {}  # seqid -> [features, genes, last end]
+        self.summary = None
+
+    def visit(self, fields, line_no):
+        """Add feature to counts and distributions."""
+        super().visit(fields, line_no)
+        feature_type = fields[2]
+        end = int(fields[4])
+        seqid = self.seqids.get(fields[0])
+        if seqid is None:
+            seqid = self.seqids[fields[0]] = [0, 0, 0]
+        seqid[0] += 1
+        if end > seqid[2]:
+            seqid[2] = end
+        if feature_type in self.lengths:
+            self.lengths[feature_type].append(end - int(fields[3]) + 1)
+            if feature_type == "gene":
+                seqid[1] += 1
+        elif feature_type == TRANSCRIPT_EXON_TYPE:
+            for parent_id in parse_ids(fields[8])[1]:
+                self.exons[parent_id] = self.exons.get(parent_id, 0) + 1
+
+    def finish(self):
+        """Return dictionary of counts by type and other statistics."""
+        exons = np.fromiter(self.exons.values(), dtype=np.int64)
+        exon_stats = length_summary(exons)
+        exon_stats["single_exon"] = int((exons == 1).sum())
+        stats = {
+            f"{t}_lengths": length_summary(self.lengths[t])
+            for t in LENGTH_TYPES
+        }
+        stats["exons_per_transcript"] = exon_stats
+        stats["seqids"] = {
+            seqid: {
+                "features": features,
+                "genes": genes,
+                "genes_per_mb": round(genes * BASES_PER_MB / max(span, 1), 2),
+            }
+            for seqid, (features, genes, span) in self.seqids.items()
+        }
+        self.summary = {"counts": self.counts, "stats": stats}
+        return self.summary
+
+
+def gff_stats(gff):
+    """Return counts and statistics of features in gff."""
+    scan = GffScan(gff)
+    scan.register(GffStats())
+    return scan.run()[0]
+
+
+def base_lookup_table():
+    """Return index in BASE_CLASSES of each byte, past its end if space."""
+    table = np.full(256, BASE_CLASSES.index("IUPAC"), dtype=np.int64)
+    for base in "ACGTN":
+        table[ord(base)] = table[ord(base.lower())] = BASE_CLASSES.index(base)
+    for whitespace in b" \t\r\n":
+        table[whitespace] = len(BASE_CLASSES)
+    return table
+
+
+BASE_LUT = base_lookup_table()
+IS_SEQUENCE = BASE_LUT < len(BASE_CLASSES)  # bytes other than whitespace
+
+
+def length_distribution(lengths):
+    """Return count, total, N50/L50, N90/L90, max, min, and mean."""
+    lengths = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+    total = int(lengths.sum())
+    distribution = {"count": len(lengths), "total": total}
+    if not total:
+        return distribution
+    cumulative = np.cumsum(lengths)
+    for name, fraction in (("50", 0.5), ("90", 0.9)):
+        index = int(np.searchsorted(cumulative, total * fraction))
+        distribution[f"N{name}"] = int(lengths[index])
+        distribution[f"L{name}"] = index + 1
+    distribution["max"] = int(lengths[0])
+    distribution["min"] = int(lengths[-1])
+    distribution["mean"] = round(total / len(lengths))
+    return distribution
+
+
+class AssemblyStats:
+
+    """Accumulate record, contig, scaffold, and gap lengths of a FASTA file.
+
+    Sequence is added as uint8 arrays without whitespace.  Runs of at
+    least min_gap Ns are gaps; records with gaps are scaffolds, split by
+    their gaps into contigs, as in sequencetools basic_fasta_stats.
+    """
+
+    def __init__(self, min_gap=MIN_GAP):
+        """Initialize empty lengths and base counts."""
+        self.min_gap = min_gap
+        self.records = 0
+        self.lengths = array("q")  # non-empty records
+        self.scaffolds = array("q")
+        self.contigs = []  # arrays of contig lengths
+        self.gaps = []  # arrays of gap lengths
+        self.byte_counts = np.zeros(256, dtype=np.int64)
+        self._length = None  # length of current record
+        self._contig_start = 0
+        self._n_start = None  # start of run of Ns at end of sequence so far
+        self._n_gaps = 0
+
+    def start_record(self):
+        """Finish the current record and start a new one."""
+        self.finish_record()
+        self.records += 1
+        self._length = 0
+        self._contig_start = 0
+        self._n_start = None
+        self._n_gaps = 0
+
+    def add(self, sequence):
+        """Add uint8 array of sequence to the current record."""
+        if not len(sequence):
+            return
+        counts = np.bincount(sequence, minlength=256)
+        self.byte_counts += counts
+        offset = self._length
+        self._length += len(sequence)
+        if not counts[ord("N")] + counts[ord("n")]:  # no gaps start here
+            if self._n_start is not None:
+                self._add_runs([self._n_start], [offset])
+                self._n_start = None
+            return
+        is_n = (sequence | 0x20) == ord("n")
+        edges = np.flatnonzero(np.diff(is_n, prepend=False, append=False))
+        starts = edges[0::2] + offset
+        ends = edges[1::2] + offset
+        if self._n_start is not None:  # run of Ns continued from before
+            if starts[0] == offset:
+                starts[0] = self._n_start
+            else:
+                starts = np.concatenate(([self._n_start], starts))
+                ends = np.concatenate(([offset], ends))
+            self._n_start = None
+        if ends[-1] == self._length:  # may continue in next array
+            self._n_start = starts[-1]
+            starts = starts[:-1]
+            ends = ends[:-1]
+        self._add_runs(starts, ends)
+
+    def _add_runs(self, starts, ends):
+        """Add runs of Ns, splitting contigs at those that are gaps."""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        is_gap = ends - starts >= self.min_gap
+        starts = starts[is_gap]
+        ends = ends[is_gap]
+        if not len(starts):
+            return
+        contigs = starts - np.concatenate(([self._contig_start], ends[:-1]))
+        self.contigs.append(contigs[contigs > 0])
+        self.gaps.append(ends - starts)
+        self._contig_start = int(ends[-1])
+        self._n_gaps += len(starts)
+
+    def finish_record(self):
+        """Add lengths of the current record, if any."""
+        if self._length is None:
+            return
+        if self._n_start is not None:
+            self._add_runs([self._n_start], [self._length])
+            self._n_start = None
+        if self._length:
+            self.lengths.append(self._length)
+        last_contig = self._length - self._contig_start
+        if last_contig > 0:
+            self.contigs.append(np.array([last_contig], dtype=np.int64))
+        if self._n_gaps:
+            self.scaffolds.append(self._length)
+        self._length = None
+
+    def metrics(self):
+        """Return dictionary of metrics, with basic_fasta_stats keys."""
+        self.finish_record()
+        records = length_distribution(self.lengths)
+        contigs = length_distribution(np.concatenate([[]] + self.contigs))
+        scaffolds = length_distribution(self.scaffolds)
+        gaps = length_distribution(np.concatenate([[]] + self.gaps))
+        bases = np.bincount(
+            BASE_LUT, weights=self.byte_counts, minlength=len(BASE_CLASSES) + 1
+        ).astype(np.int64)
+        bases = {c: int(bases[i]) for i, c in enumerate(BASE_CLASSES)}
+        total = records["total"]
+        metrics = {"records": self.records, "allbases": total}
+        for prefix, distribution in (
+            ("", records),
+            ("contig", contigs),
+            ("scaffold", scaffolds),
+            ("gap", gaps),
+        ):
+            for key in ("N50", "N90", "L50", "L90"):
+                metrics[prefix + key] = distribution.get(key, 0)
+        metrics["maxlen"] = records.get("max", 0)
+        metrics["minlen"] = records.get("min", 0)
+        metrics["record_mean"] = records.get("mean", 0)
+        for name, distribution in (
+            ("contig", contigs),
+            ("scaffold", scaffolds),
+            ("gap", gaps),
+        ):
+            metrics[f"{name}s"] = distribution["count"]
+            metrics[f"{name}bases"] = distribution["total"]
+            for key in ("max", "min", "mean"):
+                metrics[key + name] = distribution.get(key, 0)
+        metrics["bases"] = bases
+        metrics["gcbases"] = bases["G"] + bases["C"]
+        metrics["nbases"] = bases["N"]
+        if total:
+            metrics["pgc"] = round(100 * metrics["gcbases"] / total)
+            metrics["pn"] = round(100 * bases["N"] / total, 2)
+        return metrics
+
+
+def add_indexed_records(stats, fasta, block_size=FASTA_BLOCK_SIZE):
+    """Add records of uncompressed fasta, reading lines as laid out in .fai.
+
+    Newlines are dropped by reshaping whole lines into rows, so headers
+    never need to be found.
+    """
+    with open(fasta, "rb") as fh:
+        for record in read_fai(fai_path(fasta)):
+            stats.start_record()
+            fh.seek(record.offset)
+            lines_per_read = max(1, block_size // record.line_width)
+            remaining = record.length
+            while remaining:
+                n_bases = min(remaining, lines_per_read * record.line_bases)
+                full_lines, last_line = divmod(n_bases, record.line_bases)
+                data = np.frombuffer(
+                    fh.read(full_lines * record.line_width + last_line),
+                    dtype=np.uint8,
+                )
+                if len(data) < full_lines * record.line_width + last_line:
+                    raise OSError(f"{fasta} is shorter than its index")
+                lines = data[: full_lines * record.line_width].reshape(
+                    full_lines, record.line_width
+                )
+                stats.add(lines[:, : record.line_bases].ravel())
+                if last_line:
+                    stats.add(data[full_lines * record.line_width :])
+                remaining -= n_bases
+
+
+def add_scanned_records(stats, fasta, block_size=FASTA_BLOCK_SIZE):
+    """Add records of fasta, finding headers block by block."""
+    in_header = False  # header line continues in next block
+    line_start = True  # block starts at start of a line
+    in_record = False  # past first header
+    with open_input(fasta, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            data = np.frombuffer(block, dtype=np.uint8)
+            pos = 0
+            if in_header:
+                pos = block.find(b"\n") + 1
+                if not pos:
+                    continue
+                in_header = False
+            while True:
+                if block.startswith(b">", pos) and (pos or line_start):
+                    header = pos
+                else:
+                    header = next_fasta_header(block, pos)
+                end = len(block) if header == -1 else header
+                if in_record and end > pos:
+                    segment = data[pos:end]
+                    stats.add(segment[IS_SEQUENCE[segment]])
+                if header == -1:
+                    break
+                stats.start_record()
+                in_record = True
+                pos = block.find(b"\n", header) + 1
+                if not pos:
+                    in_header = True
+                    break
+            line_start = block.endswith(b"\n")
+
+
+def fasta_stats(fasta, min_gap=MIN_GAP, block_size=FASTA_BLOCK_SIZE):
+    """Return assembly metrics of fasta.
+
+    Record layout is taken from the .fai index of uncompressed FASTA
+    when the index is current; otherwise headers are found by scanning.
+    """
+    stats = AssemblyStats(min_gap=min_gap)
+    if not is_gzipped(fasta) and index_is_current(fasta):
+        add_indexed_records(stats, fasta, block_size=block_size)
+    else:
+        add_scanned_records(stats, fasta, block_size=block_size)
+    return stats.metrics()
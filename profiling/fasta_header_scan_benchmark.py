@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Compare block scanning of FASTA headers with the former line loop.
+
+Throughput is given in MB/s of uncompressed FASTA.
+
+\b
+Example:
+    python profiling/fasta_header_scan_benchmark.py --size_gb 1 --gzip
+"""
+# standard library imports
+import gzip
+import re
+import tempfile
+import time
+from pathlib import Path
+
+# first-party imports
+import click
+
+# module imports
+from bionorm.faidx import scan_headers
+from bionorm.specification_checks import return_filehandle
+
+BASES = b"ACGTTGCAAN"
+
+
+def write_synthetic_fasta(path, size, n_seqs, line_length, compress):
+    """Write a FASTA file of approximately size uncompressed bytes."""
+    line = (BASES * (line_length // len(BASES) + 1))[:line_length] + b"\n"
+    lines_per_seq = max(1, size // n_seqs // len(line))
+    seq_block = line * min(lines_per_seq, 4096)
+    if compress:
+        fh = gzip.open(path, "wb", compresslevel=1)
+    else:
+        fh = path.open("wb")
+    written = 0
+    with fh:
+        for seq_no in range(n_seqs):
+            header = f">medtr.A17.gnm5.chr{seq_no + 1} synthetic\n".encode()
+            fh.write(header)
+            written += len(header)
+            remaining = lines_per_seq
+            while remaining > 0:
+                n_lines = min(remaining, 4096)
+                fh.write(seq_block[: n_lines * len(line)])
+                written += n_lines * len(line)
+                remaining -= n_lines
+    return written
+
+
+def line_loop_headers(fasta):
+    """Collect header IDs line-by-line, as check_genome_fasta formerly did."""
+    re_header = re.compile(r"^>(\S+)\s*(.*)")
+    names = []
+    with return_filehandle(fasta) as gopen:
+        for line in gopen:
+            line = line.rstrip()
+            if not line:
+                continue
+            if re_header.match(line):
+                names.append(re_header.search(line).groups(0)[0])
+    return names
+
+
+def block_scan_headers(fasta):
+    """Collect header IDs with the block scanner."""
+    return list(scan_headers(fasta))
+
+
+@click.command()
+@click.option(
+    "--size_gb", default=1.0, show_default=True, help="Size of test FASTA."
+)
+@click.option(
+    "--n_seqs", default=1000, show_default=True, help="Number of sequences."
+)
+@click.option(
+    "--line_length", default=60, show_default=True, help="Bases per line."
+)
+@click.option(
+    "--gzip", "compress", is_flag=True, help="Gzip-compress the test FASTA."
+)
+@click.option(
+    "--workdir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory for test files [default: system temporary].",
+)
+def main(size_gb, n_seqs, line_length, compress, workdir):
+    """Time header scanning of a synthetic FASTA file."""
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        fasta_path = Path(tmp) / "synthetic.fna"
+        if compress:
+            fasta_path = Path(tmp) / "synthetic.fna.gz"
+        size = write_synthetic_fasta(
+            fasta_path,
+            int(size_gb * 1024 ** 3),
+            n_seqs,
+            line_length,
+            compress,
+        )
+        print(
+            f"synthetic FASTA: {size / 1024**2:,.0f} MB uncompressed,"
+            f" {fasta_path.stat().st_size / 1024**2:,.0f} MB on disk,"
+            f" {n_seqs} sequences"
+        )
+        results = {}
+        for name, method in (
+            ("line loop", line_loop_headers),
+            ("block scanner", block_scan_headers),
+        ):
+            start = time.perf_counter()
+            results[name] = method(fasta_path)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>14}: {elapsed:8.2f} s,"
+                f" {size / 1024**2 / elapsed:8.1f} MB/s,"
+                f" {len(results[name])} headers"
+            )
+        if results["line loop"] != results["block scanner"]:
+            print("WARNING: header lists differ")
+
+
+if __name__ == "__main__":
+    main()
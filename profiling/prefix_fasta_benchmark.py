@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Compare block-oriented FASTA prefixing with the former line loop.
+
+\b
+Example:
+    python profiling/prefix_fasta_benchmark.py --size_gb 2
+"""
+# standard library imports
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# first-party imports
+import click
+from loguru import logger
+
+# module imports
+from bionorm.prefix import rewrite_fasta_headers
+
+NAME_PREFIX = "medtr.jemalong_A17.gnm5"
+BASES = b"ACGTTGCAAN"
+
+
+def write_synthetic_fasta(path, size, n_seqs, line_length):
+    """Write a FASTA file of approximately size bytes."""
+    line = (BASES * (line_length // len(BASES) + 1))[:line_length] + b"\n"
+    lines_per_seq = max(1, size // n_seqs // len(line))
+    seq_block = line * min(lines_per_seq, 4096)
+    with path.open("wb") as fh:
+        for seq_no in range(n_seqs):
+            fh.write(f">chr{seq_no + 1} synthetic sequence\n".encode())
+            remaining = lines_per_seq
+            while remaining > 0:
+                n_lines = min(remaining, 4096)
+                fh.write(seq_block[: n_lines * len(line)])
+                remaining -= n_lines
+    return path.stat().st_size
+
+
+def line_loop_prefix(fastafile, outfile, name_prefix):
+    """Prefix headers line-by-line, as prefix_fasta formerly did."""
+    re_header = re.compile(r"^>(\S+)\s*(.*)")
+    n_headers = 0
+    with Path(fastafile).open("r") as gopen, Path(outfile).open("w") as new:
+        for line in gopen:
+            line = line.rstrip()
+            if re_header.match(line):
+                parsed_header = re_header.search(line).groups()
+                logger.debug(line)
+                logger.debug(parsed_header)
+                hid = parsed_header[0]
+                desc = parsed_header[1]
+                new_header = f">{name_prefix}.{hid} {desc}"
+                n_headers += 1
+                logger.debug(hid)
+                logger.debug(desc)
+                logger.debug(new_header)
+                new.write(new_header + "\n")
+            else:
+                new.write(line + "\n")
+    return n_headers
+
+
+def block_prefix(fastafile, outfile, name_prefix):
+    """Prefix headers with the block rewriter."""
+    with Path(fastafile).open("rb") as gopen:
+        with Path(outfile).open("wb") as new:
+            return rewrite_fasta_headers(gopen, new, name_prefix)
+
+
+@click.command()
+@click.option(
+    "--size_gb", default=2.0, show_default=True, help="Size of test FASTA."
+)
+@click.option(
+    "--n_seqs", default=8, show_default=True, help="Number of sequences."
+)
+@click.option(
+    "--line_length", default=60, show_default=True, help="Bases per line."
+)
+@click.option(
+    "--workdir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory for test files [default: system temporary].",
+)
+def main(size_gb, n_seqs, line_length, workdir):
+    """Time prefixing of a synthetic FASTA file."""
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        tmp_path = Path(tmp)
+        fasta_path = tmp_path / "synthetic.fna"
+        size = write_synthetic_fasta(
+            fasta_path, int(size_gb * 1024 ** 3), n_seqs, line_length
+        )
+        print(f"synthetic FASTA: {size / 1024**2:,.0f} MB, {n_seqs} sequences")
+        for name, method in (
+            ("line loop", line_loop_prefix),
+            ("block rewriter", block_prefix),
+        ):
+            out_path = tmp_path / "prefixed.fna"
+            start = time.perf_counter()
+            n_headers = method(fasta_path, out_path, NAME_PREFIX)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>15}: {elapsed:8.2f} s,"
+                f" {size / 1024**2 / elapsed:8.1f} MB/s,"
+                f" {n_headers} headers"
+            )
+            out_path.unlink()
+
+
+if __name__ == "__main__":
+    main()
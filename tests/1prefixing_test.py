@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 # standard library imports
+import io
 from pathlib import Path
 
 # first-party imports
@@ -7,12 +8,15 @@ import pytest
 import sh
 
 # module imports
+from bionorm.prefix import rewrite_fasta_headers
+
 from . import ANN_PATH
 from . import FASTA_PATH
 from . import GENOME_PATH
 from . import GFF_PATH
 from . import fasta_count
 from . import line_count
+from . import working_directory
 
 DOWNLOAD_URL = "http://generisbio.com/ncgr/"
 RAW_FASTA_FILE = "example_jemalong.fna"
@@ -62,8 +66,11 @@ def test_prefix_gff(datadir_mgr):
         subdirname = list(outdir_path.glob("*"))[0].parts[-1]
         assert subdirname == ANN_PATH.parts[1]
         subdir_path = outdir_path / subdirname
-        outfilename = list(subdir_path.glob("*"))[0].name
-        assert outfilename == GFF_PATH.parts[2]
+        outfilelist = [
+            p.name for p in subdir_path.glob("*") if not p.name.startswith("_")
+        ]
+        assert outfilelist == [GFF_PATH.parts[2]]
+        assert (subdir_path / f"_{outfilelist[0]}.source.json").exists()
         assert line_count(Path(RAW_GFF_FILE)) == line_count(GFF_PATH)
 
 
@@ -110,6 +117,107 @@ def test_prefix_fasta(datadir_mgr):
         subdirname = list(outdir_path.glob("*"))[0].parts[-1]
         assert subdirname == GENOME_PATH.parts[1]
         subdir_path = outdir_path / subdirname
-        outfilename = list(subdir_path.glob("*"))[0].name
-        assert outfilename == FASTA_PATH.parts[2]
+        outfilelist = [
+            p.name for p in subdir_path.glob("*") if not p.name.startswith("_")
+        ]
+        assert outfilelist == [FASTA_PATH.parts[2]]
+        assert (subdir_path / f"_{outfilelist[0]}.source.json").exists()
+        assert fasta_count(Path(RAW_FASTA_FILE)) == fasta_count(FASTA_PATH)
+
+
+def test_prefix_batch(datadir_mgr):
+    """Test command prefix-batch."""
+    datadir_mgr.download(
+        download_url=DOWNLOAD_URL,
+        files=[RAW_FASTA_FILE, RAW_GFF_FILE],
+        scope="function",
+        md5_check=True,
+        gunzip=True,
+        progressbar=False,
+    )
+    with datadir_mgr.in_tmp_dir(
+        inpathlist=[RAW_FASTA_FILE, RAW_GFF_FILE],
+        save_outputs=False,
+        excludepatterns=["*.log"],
+    ):
+        manifest = Path("manifest.tsv")
+        with manifest.open("w") as fh:
+            fh.write("file\tgenus\tspecies\tinfra_id\tgenver\tannver\tkey\n")
+            for filename, annver in (
+                (RAW_FASTA_FILE, ""),
+                (RAW_GFF_FILE, "1"),
+            ):
+                fh.write(
+                    f"{filename}\tmedicago\ttruncatula\tjemalong_A17\t5"
+                    f"\t{annver}\tFAKE\n"
+                )
+        try:
+            output = sh.bionorm(["prefix-batch", "--jobs", "2", str(manifest)])
+        except sh.ErrorReturnCode as e:
+            print(e)
+            pytest.fail(e)
+        print(output)
+        assert line_count(Path(RAW_GFF_FILE)) == line_count(GFF_PATH)
         assert fasta_count(Path(RAW_FASTA_FILE)) == fasta_count(FASTA_PATH)
+
+
+def test_prefix_batch_bad_file(tmp_path):
+    """Test that prefix-batch writes good files when one file fails."""
+    good_gff = tmp_path / "good.gff3"
+    good_gff.write_text(
+        "##gff-version 3\n"
+        "chr1\ttest\tgene\t1\t90\t.\t+\t.\tID=gene1\n"
+        "chr1\ttest\tmRNA\t1\t90\t.\t+\t.\tID=gene1.1;Parent=gene1\n"
+    )
+    bad_gff = tmp_path / "bad.gff3"
+    bad_gff.write_text(
+        "##gff-version 3\nchr1\ttest\tgene\tone\t90\t.\t+\t.\tID=gene1\n"
+    )
+    fasta = tmp_path / "genome.fna"
+    fasta.write_text(">chr1\nACGT\n>chr2\nGGCC\n")
+    manifest = tmp_path / "manifest.tsv"
+    with manifest.open("w") as fh:
+        fh.write("file\tgenus\tspecies\tinfra_id\tgenver\tannver\tkey\n")
+        fh.write("genome.fna\tmedicago\ttruncatula\tA17\t5\t\tFAKE\n")
+        for filename, annver in (("good.gff3", 1), ("bad.gff3", 2)):
+            fh.write(
+                f"{filename}\tmedicago\ttruncatula\tA17\t5\t{annver}\tFAKE\n"
+            )
+    for jobs in ("1", "2"):
+        with working_directory(tmp_path):
+            output = sh.bionorm(
+                ["prefix-batch", "--jobs", jobs, str(manifest)],
+                _ok_code=[1],
+            )
+        print(output)
+        species_dir = tmp_path / "Medicago_truncatula"
+        gff_out = (
+            species_dir
+            / "A17.gnm5.ann1.FAKE"
+            / "medtr.A17.gnm5.ann1.FAKE.gene_models_main.gff3"
+        )
+        fasta_out = (
+            species_dir
+            / "A17.gnm5.FAKE"
+            / "medtr.A17.gnm5.FAKE.genome_main.fna"
+        )
+        assert line_count(gff_out) == line_count(good_gff)
+        assert fasta_count(fasta_out) == fasta_count(fasta)
+        # no output, partial output, or sort run directory left behind
+        assert not list((species_dir / "A17.gnm5.ann2.FAKE").iterdir())
+
+
+def test_rewrite_fasta_headers():
+    """Test that LF and CRLF input give the same prefixed FASTA."""
+    expected = b">P.a \nACGT\n>P.b x y\nGG\n\nTT\n"
+    for data in (
+        b">a\nACGT\n>b x y\nGG\n\nTT",
+        b">a\r\nACGT\r\n>b  x y \r\nGG\r\n\r\nTT\r\n",
+    ):
+        for block_size in (1, 2, 5, 1024):
+            out_fh = io.BytesIO()
+            n_headers = rewrite_fasta_headers(
+                io.BytesIO(data), out_fh, "P", block_size=block_size
+            )
+            assert n_headers == 2
+            assert out_fh.getvalue() == expected
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# standard library imports
+import random
+from functools import partial
+
+# module imports
+from bionorm.gff import UNRANKED
+from bionorm.gff import FeatureSorter
+from bionorm.gff import TypeHierarchy
+from bionorm.gff import parse_ids
+from bionorm.gff import prefix_attributes
+from bionorm.gff import rewrite_feature
+
+TYPE_RANKS = {"gene": 1, "mRNA": 2, "exon": 3, "CDS": 3}
+
+
+def random_features(n_features, seed=1):
+    """Return GFF3 feature lines with many ties in start."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n_features):
+        seqid = rng.choice(["chr2", "chr10", "chr1", "scaffold_7"])
+        start = rng.randint(1, 50)
+        feature_type = rng.choice(list(TYPE_RANKS) + ["repeat_region"])
+        lines.append(
+            f"{seqid}\ttest\t{feature_type}\t{start}\t{start + 9}"
+            f"\t.\t+\t.\tID=f{i};Parent=f{i // 2}"
+        )
+    return lines
+
+
+def sorted_text(
+    lines, max_bytes=None, jobs=1, tmpdir=None, hierarchy=None
+):
+    """Return sorted and rewritten text of lines."""
+    with FeatureSorter(tmpdir=tmpdir, hierarchy=hierarchy) as sorter:
+        sorter.max_bytes = max_bytes
+        for line in lines:
+            fields = line.split("\t")
+            sorter.add(line, fields)
+            if hierarchy is not None:
+                feature_id, parent_ids = parse_ids(fields[8])
+                hierarchy.add_feature(feature_id, fields[2], parent_ids)
+        rewrite = partial(
+            rewrite_feature, seqid_prefix="medtr.", feature_prefix="medtr.ann"
+        )
+        rank = lambda t: TYPE_RANKS.get(t, 1000)
+        return "".join(sorter.sorted_lines(rank, rewrite, jobs=jobs))
+
+
+def test_feature_sorter_modes(tmp_path):
+    """Test that spilling and jobs do not change sorted output."""
+    lines = random_features(2000)
+    in_memory = sorted_text(lines)
+    assert in_memory.count("\n") == len(lines)
+    previous = None
+    for line in in_memory.splitlines():
+        fields = line.split("\t")
+        key = (fields[0], int(fields[3]))
+        if previous is not None and key[0] == previous[0]:
+            assert key[1] >= previous[1]
+        previous = key
+    for max_bytes in (500, 20000):
+        assert sorted_text(lines, max_bytes, tmpdir=tmp_path) == in_memory
+    hierarchy = TypeHierarchy()  # outgrows max_bytes, counted against it
+    assert (
+        sorted_text(lines, 20000, tmpdir=tmp_path, hierarchy=hierarchy)
+        == in_memory
+    )
+    assert hierarchy.nbytes > 20000
+    for jobs in (2, 3):
+        assert sorted_text(lines, jobs=jobs) == in_memory
+    assert not list(tmp_path.iterdir())  # run files removed
+
+
+def test_type_hierarchy():
+    """Test type ranks, cycles, and missing parents."""
+    hierarchy = TypeHierarchy()
+    features = [
+        ("g1", "gene", ()),
+        ("t1", "mRNA", ("g1",)),
+        ("e1", "exon", ("t1",)),
+        ("c1", "CDS", ("t1", "t2")),  # t2 is missing
+        ("p1", "polypeptide", ("c1",)),
+        ("g2", "gene", ("g1",)),  # nesting within a type is not a cycle
+        ("a1", "A", ("b1",)),
+        ("b1", "B", ("a1",)),
+        ("x1", "X", ("a1", "t1")),  # below a cycle
+        (None, "region", ("nowhere",)),
+    ]
+    for line_no, (feature_id, feature_type, parent_ids) in enumerate(
+        features, 1
+    ):
+        hierarchy.add_feature(feature_id, feature_type, parent_ids, line_no)
+    assert hierarchy.rank() == {
+        "gene": 1,
+        "region": 1,
+        "mRNA": 2,
+        "exon": 3,
+        "CDS": 3,
+        "polypeptide": 4,
+    }
+    assert hierarchy.cyclic_types == ["A", "B", "X"]
+    assert hierarchy.missing_parents == [4, 10]
+    assert hierarchy.type_rank("X") == UNRANKED
+    assert TypeHierarchy().rank() == {}
+
+
+def test_attribute_keys():
+    """Test that ID and Parent keys are found despite whitespace."""
+    attributes = "ID=t1; Parent=g1,g2 ;Name=t1;myID=x;Parent_of=y"
+    assert parse_ids(attributes) == ("t1", ("g1", "g2 "))
+    assert prefix_attributes(attributes, "p") == (
+        "ID=p.t1; Parent=p.g1,p.g2 ;Name=t1;myID=x;Parent_of=y"
+    )
+    assert prefix_attributes(" ID =t1;Name=t1", "p", prefix_name=True) == (
+        " ID =p.t1;Name=p.t1"
+    )
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# standard library imports
+import json
+import os
+
+# module imports
+import bionorm.outputs
+from bionorm.common import args_to_pathlist
+from bionorm.outputs import AtomicOutputs
+from bionorm.outputs import sidecar_path
+
+
+def write_output(source, output, options):
+    """Write output from source atomically."""
+    outputs = AtomicOutputs([output], [source], options)
+    with outputs:
+        outputs.path(output).write_text(source.read_text().upper())
+        outputs.commit()
+    return outputs
+
+
+def test_atomic_outputs_staleness(tmp_path):
+    """Test that changed inputs, options, or version make outputs stale."""
+    source = tmp_path / "source.txt"
+    source.write_text("acgt\n")
+    output = tmp_path / "output.txt"
+    options = {"command": "test"}
+    write_output(source, output, options)
+    assert output.read_text() == "ACGT\n"
+    assert not list(tmp_path.glob("*.partial"))
+    for recurse in (False, True):  # sidecars are not data files
+        listed = args_to_pathlist((str(tmp_path),), False, recurse)
+        assert sorted(listed) == [output, source]
+    assert AtomicOutputs([output], [source], options).up_to_date()
+    assert not AtomicOutputs([output], [source], {"x": 1}).up_to_date()
+    record = json.loads(sidecar_path(output).read_text())
+    record["version"] = "0.0.0"
+    sidecar_path(output).write_text(json.dumps(record))
+    assert not AtomicOutputs([output], [source], options).up_to_date()
+    write_output(source, output, options)
+    source.write_text("acgtn\n")
+    assert not AtomicOutputs([output], [source], options).up_to_date()
+
+
+def test_atomic_outputs_checksums(tmp_path, monkeypatch):
+    """Test that inputs are checksummed only when they may have changed."""
+    checksummed = []
+    file_checksum = bionorm.outputs.file_checksum
+    monkeypatch.setattr(
+        bionorm.outputs,
+        "file_checksum",
+        lambda path: checksummed.append(path) or file_checksum(path),
+    )
+    source = tmp_path / "source.txt"
+    source.write_text("acgt\n")
+    output = tmp_path / "output.txt"
+    options = {"command": "test"}
+    write_output(source, output, options)
+    assert len(checksummed) == 1
+    write_output(source, output, options)  # same size and mtime
+    assert len(checksummed) == 1
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert AtomicOutputs([output], [source], options).up_to_date()
+    assert len(checksummed) == 2  # touched, content compared
+    write_output(source, output, options)
+    assert len(checksummed) == 3
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# standard library imports
+import gzip
+import os
+
+# module imports
+import bionorm.check_cache
+from bionorm.check_cache import CheckCache
+from bionorm.check_cache import file_state
+from bionorm.consistency import Detector
+from bionorm.consistency import read_metadata_header
+
+from . import working_directory
+
+
+def test_read_metadata_header(tmp_path):
+    """Test that malformed header lines do not hide later keys."""
+    gwas = tmp_path / "glyma.gwas.tsv.gz"
+    with gzip.open(gwas, "wt") as fh:
+        fh.write(
+            "#metadata\n"
+            "ScientificName\tGlycine max\t\n"
+            "lonely field\n"
+            "#PlatformName\tSoySNP50K\n"
+            "#data\n"
+            "identifier\tphenotype\tmarker\tpvalue\n"
+            "Trait\tSomething\n"
+        )
+    header = read_metadata_header(gwas)
+    assert header == {
+        "ScientificName": "Glycine max",
+        "PlatformName": "SoySNP50K",
+    }
+
+
+def test_check_cache_invalidation(tmp_path, monkeypatch):
+    """Test that cached results go stale when their inputs change."""
+    target = tmp_path / "genes.gff3"
+    parent = tmp_path / "genome.fna"
+    target.write_text("##gff-version 3\n")
+    parent.write_text(">chr1\nACGT\n")
+    cache = CheckCache(tmp_path, {"nodes": False})
+    state = file_state(target, parent)  # taken before checking
+    target.write_text("##gff-version 3\n#changed while checked\n")
+    cache.store(target, state, True, {"chr1"}, {"gene": 1})
+    assert cache.lookup(target, parent) is None
+    state = file_state(target, parent)
+    cache.store(target, state, True, {"chr1"}, {"gene": 1})
+    cached = cache.lookup(target, parent)
+    assert cached == (True, frozenset({"chr1"}), {"gene": 1})
+    assert CheckCache(tmp_path, {"nodes": True}).lookup(target, parent) is None
+    stat = os.stat(target)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.lookup(target, parent) is None  # mtime changed
+    cache.store(target, file_state(target, parent), True)
+    target.write_text("##gff-version 3\n\n")
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.lookup(target, parent) is None  # size changed
+    cache.store(target, file_state(target, None), False)
+    assert cache.lookup(target, None) == (False, frozenset(), None)
+    assert cache.lookup(target, parent) is None  # parent changed
+    monkeypatch.setattr(bionorm.check_cache, "__version__", "0.0.0")
+    assert cache.lookup(target, None) is None  # version changed
+    cache.close()
+
+
+def test_parallel_detector(tmp_path):
+    """Test that checks in a process pool match checks in series."""
+    species = tmp_path / "Medicago_truncatula"
+    genome = species / "A17.gnm5.FAKE"
+    genome.mkdir(parents=True)
+    fasta = genome / "medtr.A17.gnm5.FAKE.genome_main.fna.gz"
+    with gzip.open(fasta, "wt") as fh:
+        fh.write(">medtr.A17.gnm5.chr1\nACGTACGTAC\nGT\n")
+        fh.write(">medtr.A17.gnm5.chr2\nAA\n")
+    for annotation, seqid in (("ann1.FAKE", "chr1"), ("ann2.ZZZZ", "chrX")):
+        prefix = f"medtr.A17.gnm5.{annotation}"
+        annotation_dir = species / f"A17.gnm5.{annotation}"
+        annotation_dir.mkdir()
+        gff = annotation_dir / f"{prefix}.gene_models_main.gff3.gz"
+        with gzip.open(gff, "wt") as fh:
+            fh.write(
+                "##gff-version 3\n"
+                f"medtr.A17.gnm5.{seqid}\t.\tgene\t1\t9\t.\t+\t.\t"
+                f"ID={prefix}.g1\n"
+            )
+    results = []
+    for jobs in (1, 2):
+        node_dir = tmp_path / f"nodes_{jobs}"
+        node_dir.mkdir()
+        detector = Detector(
+            str(species),
+            busco=False,
+            nodes=True,
+            genome_main=True,
+            gene_models_main=True,
+            genometools=False,
+            fasta_headers=False,
+            disable_all=False,
+            jobs=jobs,
+            use_cache=False,
+        )
+        with working_directory(node_dir):
+            detector.detect_incongruencies()
+        assert not detector.feature_counts  # none kept for failed files
+        assert detector.root_target == species
+        nodes = {p.name: p.read_text() for p in node_dir.iterdir()}
+        results.append((detector.passed, nodes))
+    assert results[0] == results[1]
+    passed, nodes = results[0]
+    assert sorted(passed.values()) == [0, 1, 1]  # ann2 seqid not in genome
+    assert len(nodes) == 2
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# standard library imports
+import gzip
+import mmap
+import random
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+
+# third-party imports
+import pytest
+
+# module imports
+from bionorm.bgzf import BGZF_BLOCK_SIZE
+from bionorm.bgzf import BgzfReader
+from bionorm.bgzf import BgzfWriter
+from bionorm.bgzf import default_threads
+from bionorm.bgzf import open_input
+from bionorm.extract_fasta import longest_isoforms
+from bionorm.extract_fasta import run_extraction
+from bionorm.extraction import Transcript
+from bionorm.extraction import extract_transcript
+from bionorm.extraction import merge_partitions
+from bionorm.extraction import reverse_complement
+from bionorm.extraction import splice
+from bionorm.extraction import translate
+from bionorm.faidx import HeaderSource
+from bionorm.faidx import IndexedFasta
+from bionorm.faidx import build_fai
+from bionorm.faidx import build_gzi
+from bionorm.faidx import fai_path
+from bionorm.faidx import open_genome
+from bionorm.faidx import read_gzi
+from bionorm.faidx import scan_headers
+from bionorm.faidx import write_fai
+from bionorm.faidx import write_gzi
+from bionorm.faidx import write_indexes
+from bionorm.stats import fasta_stats
+
+
+def test_header_names(tmp_path):
+    """Test that scanned and indexed header names agree."""
+    fasta = tmp_path / "genome.fna"
+    fasta.write_bytes(
+        b">chr1 first\nACGT\n>  chr2\tsecond\nAC\n>\nGG\n> \t\nTT\n"
+    )
+    names = ["chr1", "chr2", "", ""]
+    for block_size in (1, 5, 1024):
+        assert list(scan_headers(fasta, block_size=block_size)) == names
+    assert list(HeaderSource(fasta)) == names
+    write_fai(build_fai(fasta), fai_path(fasta))
+    source = HeaderSource(fasta)
+    assert "index" in repr(source)
+    assert list(source) == names[:3]  # samtools keeps one of a name
+
+
+def test_fai_as_samtools(tmp_path):
+    """Test .fai and .gzi indexes against those of samtools faidx."""
+    fasta = tmp_path / "genome.fna"
+    expected = {  # FASTA -> .fai written by samtools faidx
+        b">a desc\nACGT\nACGT\nAC\n>b\nAAAA\n": (
+            "a\t10\t8\t4\t5\nb\t4\t24\t4\t5\n"
+        ),
+        b">a\r\nACGT\r\nAC\r\n>b\r\nGG\r\n": (
+            "a\t6\t4\t4\t6\nb\t2\t18\t2\t4\n"
+        ),
+    }
+    for data, fai in expected.items():
+        fasta.write_bytes(data)
+        for block_size in (1, 3, 1024):
+            write_fai(build_fai(fasta, block_size), fai_path(fasta))
+            assert fai_path(fasta).read_text() == fai
+    for data in (
+        b">a\nAC\nACGT\n",  # longer line after a short one
+        b">a\nACGT\n\nACGT\n",  # blank line within sequence
+        b">a\nACGT\nAC\nAC\n",  # two short lines
+    ):
+        fasta.write_bytes(data)
+        with pytest.raises(ValueError):
+            build_fai(fasta)
+    sequence = bytes(range(65, 91)) * 10000
+    data = b">s1\n" + b"\n".join(
+        sequence[i : i + 60] for i in range(0, len(sequence), 60)
+    )
+    fasta.write_bytes(data + b"\n")
+    records = build_fai(fasta)
+    compressed = tmp_path / "genome.fna.gz"
+    with BgzfWriter(compressed) as fh:
+        fh.write(data + b"\n")
+    assert build_fai(compressed) == records
+    blocks = build_gzi(compressed)
+    assert list(blocks[1]) == list(range(0, len(data) + 1, BGZF_BLOCK_SIZE))
+    write_gzi(blocks, tmp_path / "test.gzi")
+    for expected_offsets, offsets in zip(
+        blocks, read_gzi(tmp_path / "test.gzi")
+    ):
+        assert list(offsets) == list(expected_offsets)
+    write_indexes(compressed)
+    with IndexedFasta(compressed) as genome:
+        assert genome.sequence("s1") == sequence
+        assert genome.fetch("s1", 70000, 70100) == sequence[70000:70100]
+
+
+def test_bgzf_round_trip(tmp_path):
+    """Test BGZF round trips, CRC checks, and worker thread counts."""
+    path = tmp_path / "data.gz"
+    data = bytes(range(256)) * (3 * BGZF_BLOCK_SIZE // 256 + 7)
+    with BgzfWriter(path) as fh:
+        fh.write(data[:1000])
+        fh.write(data[1000:])
+    assert gzip.decompress(path.read_bytes()) == data
+    for threads in (1, 3):
+        with BgzfReader(path, threads=threads) as fh:
+            assert fh.read() == data
+    with open_input(path) as fh:
+        assert fh.read() == data
+    raw = bytearray(path.read_bytes())
+    raw[raw.index(b"BC") + 100] ^= 0xFF  # corrupt the first block
+    path.write_bytes(raw)
+    with pytest.raises(OSError, match="fails CRC"):
+        with BgzfReader(path, threads=2) as fh:
+            fh.read()
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(default_threads).result() == 1
+
+
+def test_extraction_bounds_and_index(tmp_path):
+    """Test that extraction checks bounds and leaves the genome alone."""
+    transcript = Transcript("t1", "g1", "chr1", "+", [(0, 9)], [(0, 9, "0")])
+    assert extract_transcript(transcript, b"ATGAAATAA") == (
+        b"ATGAAATAA",
+        b"ATGAAATAA",
+        b"MK.",
+    )
+    with pytest.raises(ValueError, match="t1 ends at 9, past the end"):
+        extract_transcript(transcript, b"ATGAAATA")
+    genome_dir = tmp_path / "genome"
+    genome_dir.mkdir()
+    fasta = genome_dir / "genome.fna"
+    fasta.write_bytes(b">chr1\nATGAAA\nTAA\n")
+    gff = tmp_path / "sp.strain.gnm1.ann1.KEY.gene_models_main.gff3"
+    gff.write_text(
+        "##gff-version 3\n"
+        "chr1\t.\tgene\t1\t9\t.\t+\t.\tID=g1\n"
+        "chr1\t.\tmRNA\t4\t9\t.\t+\t.\tID=t0;Parent=g1\n"
+        "chr1\t.\tCDS\t4\t9\t.\t+\t0\tParent=t0\n"
+        "chr1\t.\tmRNA\t1\t9\t.\t+\t.\tID=t1;Parent=g1\n"
+        "chr1\t.\tCDS\t1\t9\t.\t+\t0\tParent=t1\n"
+    )
+    run_extraction(str(gff), str(fasta))
+    assert [p.name for p in genome_dir.iterdir()] == ["genome.fna"]
+    protein = tmp_path / "sp.strain.gnm1.ann1.KEY.protein.faa"
+    primary = protein.with_name(
+        "sp.strain.gnm1.ann1.KEY.protein_primaryTranscript.faa"
+    )
+    assert protein.read_bytes() == b">t0\nK.\n>t1\nMK.\n"
+    assert primary.read_bytes() == b">t1\nMK.\n"
+    run_extraction(str(gff), str(fasta), force=True, write_index=True)
+    assert fai_path(fasta).is_file()
+    assert protein.read_bytes() == b">t0\nK.\n>t1\nMK.\n"
+
+
+def test_translate_and_phase():
+    """Test IUPAC codons and CDS phase on both strands."""
+    # CTN, YTR: L; NNN, RAY (N or D): X; TAR: stop; MGR: R; partial dropped
+    assert translate(b"ATGCTNYTRNNNRAYTARMGRatgAT") == b"MLLXX.RM"
+    cds = b"ATGAAACTNTAA"
+    plus = b"C" + cds[:5] + b"GT" + cds[5:] + b"AG"
+    segments = [(0, 6, "1"), (8, 15, "0")]  # phase of first segment
+    transcript = Transcript("t1", "g1", "chr1", "+", segments, segments)
+    assert extract_transcript(transcript, plus)[1:] == (cds, b"MKL.")
+    minus = reverse_complement(plus)
+    segments = [(2, 9, "0"), (11, 17, "1")]  # first is last on - strand
+    transcript = Transcript("t1", "g1", "chr1", "-", segments, segments)
+    assert extract_transcript(transcript, minus)[1:] == (cds, b"MKL.")
+
+
+def random_fasta(seed=1):
+    """Return FASTA bytes of records with gaps and varied line widths."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(6):
+        pieces = []
+        for _ in range(rng.randint(1, 6)):  # contigs joined by gaps
+            length = rng.randint(1, 600)
+            pieces.append(bytes(rng.choices(b"ACGTacgtRYn", k=length)))
+            pieces.append(b"N" * rng.randint(0, 30))
+        sequence = b"".join(pieces)
+        width = rng.choice((50, 60, 61))
+        records.append(f">s{i} record {i}\n".encode())
+        for start in range(0, len(sequence), width):
+            records.append(sequence[start : start + width] + b"\n")
+    return b"".join(records)
+
+
+def test_fasta_stats_paths(tmp_path):
+    """Test that stats from .fai records equal stats from a scan."""
+    fasta = tmp_path / "genome.fna"
+    compressed = tmp_path / "genome.fna.gz"
+    for line_end in (b"\n", b"\r\n"):
+        data = random_fasta().replace(b"\n", line_end)
+        fasta.write_bytes(data)
+        compressed.write_bytes(gzip.compress(data))
+        if fai_path(fasta).exists():
+            fai_path(fasta).unlink()
+        scanned = fasta_stats(fasta)
+        assert scanned["gaps"] and scanned["records"] == 6
+        assert fasta_stats(compressed) == scanned
+        write_indexes(fasta)
+        for block_size in (7, 64, 1 << 16):
+            assert fasta_stats(fasta, block_size=block_size) == scanned
+
+
+def test_merge_partitions():
+    """Test that partitions are merged in order with few in flight."""
+    transcripts = [
+        Transcript(f"t{i}", "g", seqid, "+", [], [])
+        for i, seqid in enumerate("aabcbdddeffg")
+    ]
+    partitions = {}
+    for transcript in transcripts:
+        partitions.setdefault(transcript.seqid, []).append(transcript)
+    submitted = []
+
+    def submit(partition):
+        """Return finished future of IDs of partition."""
+        submitted.append(partition[0].seqid)
+        future = Future()
+        future.set_result([transcript.id for transcript in partition])
+        return future
+
+    merged = merge_partitions(transcripts, partitions, submit, 2)
+    furthest = 0  # position of last seqid reached
+    for i, record in enumerate(merged):
+        assert record == f"t{i}"
+        position = list(partitions).index(transcripts[i].seqid)
+        furthest = max(furthest, position)
+        assert len(submitted) <= furthest + 3  # jobs + 1 ahead
+    assert submitted == list(partitions)
+
+
+def test_longest_isoforms(tmp_path):
+    """Test isoform offsets and headers without ID."""
+    peptides = tmp_path / "genes.protein.faa"
+    peptides.write_bytes(b">g1.1 x\nMK\n>g1.2\nMKL\nM\n>g2\nM\n")
+    assert longest_isoforms(peptides) == (
+        3,
+        {"g1": (4, 11, 12), "g2": (1, 23, 6)},
+    )
+    peptides.write_bytes(b">g1.1\nMK\n>\nMKL\n")
+    with pytest.raises(ValueError, match="Record 2 .* has no ID"):
+        longest_isoforms(peptides)
+
+
+def test_splice_views(tmp_path):
+    """Test that spliced segments are gathered from uncopied lines."""
+    fasta = tmp_path / "genome.fna"
+    sequence = b"ACGTTGCAAACCGGTT"
+    fasta.write_bytes(b">s\nACGT\nTGCA\nAACC\nGGTT\n")
+    write_indexes(fasta)
+    segments = [(2, 9), (10, 15)]
+    expected = sequence[2:9] + sequence[10:15]
+    with open_genome(fasta) as genome:
+        view = genome.sequence("s")
+        pieces = view.pieces(2, 9)
+        assert [bytes(p) for p in pieces] == [b"GT", b"TGCA", b"A"]
+        assert all(isinstance(p.obj, mmap.mmap) for p in pieces)
+        del pieces
+        assert splice(view, segments, "+") == expected
+        assert splice(view, segments, "-") == reverse_complement(expected)
+    assert splice(sequence, segments, "+") == expected
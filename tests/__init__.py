@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 # standard library imports
+import contextlib
+import os
 from pathlib import Path
 
 # global constants
@@ -45,3 +47,14 @@ def fasta_count(filepath):
             lines += buf.count(b">")
             buf = read_f(buf_size)
     return lines
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Change working directory in context."""
+    prev_cwd = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev_cwd)